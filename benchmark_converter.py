@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Benchmark DocxToPdfConverter trên corpus DOCX tổng hợp
+Đo latency p50/p95, docs/phút, peak RSS và thời gian từng stage
+(profile creation, soffice startup, conversion, move); kết quả ghi ra JSON
+"""
+
+import os
+import sys
+import json
+import math
+import platform
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import zipfile
+import zlib
+from pathlib import Path
+import logging
+
+try:
+    from docx import Document
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import Inches
+except ImportError:
+    print("❌ Cần cài đặt: pip install python-docx")
+    sys.exit(1)
+
+from docx_converter_fixed import DocxToPdfConverter
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Corpus profiles: kích thước, mật độ heading/bookmark, ảnh và bảng
+CORPUS_PROFILES = {
+    "letter": {"pages": 2, "headings_per_page": 1, "bookmarks_per_page": 1,
+               "images": 0, "image_kb": 0, "tables": 0},
+    "report": {"pages": 20, "headings_per_page": 2, "bookmarks_per_page": 2,
+               "images": 5, "image_kb": 100, "tables": 5},
+    "contract": {"pages": 100, "headings_per_page": 3, "bookmarks_per_page": 4,
+                 "images": 2, "image_kb": 50, "tables": 20},
+    "annex": {"pages": 400, "headings_per_page": 2, "bookmarks_per_page": 2,
+              "images": 20, "image_kb": 200, "tables": 40},
+}
+
+# Tăng khi cách sinh document thay đổi để corpus cũ trong --corpus-dir được tạo lại
+CORPUS_VERSION = 2
+
+FILLER_TEXT = (
+    "Điều khoản này quy định quyền và nghĩa vụ của các bên trong hợp đồng. "
+    "The parties agree to the terms and conditions set out in this document. "
+) * 6
+
+
+def make_png(image_kb):
+    """Tạo PNG noise (không nén được) có dung lượng xấp xỉ image_kb"""
+    side = max(8, int(math.sqrt(image_kb * 1024 / 3)))
+    raw = b''.join(b'\x00' + os.urandom(side * 3) for _ in range(side))
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def add_bookmark(paragraph, bookmark_id, name):
+    """Bọc paragraph bằng w:bookmarkStart/w:bookmarkEnd"""
+    start = OxmlElement('w:bookmarkStart')
+    start.set(qn('w:id'), str(bookmark_id))
+    start.set(qn('w:name'), name)
+    end = OxmlElement('w:bookmarkEnd')
+    end.set(qn('w:id'), str(bookmark_id))
+    paragraph._p.insert(0, start)
+    paragraph._p.append(end)
+
+
+def set_page_count(docx_path, pages):
+    """Ghi số trang vào docProps/app.xml (python-docx không cập nhật field này)"""
+    tmp_path = docx_path + '.tmp'
+    with zipfile.ZipFile(docx_path) as src, zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == 'docProps/app.xml':
+                text = data.decode('utf-8')
+                if '<Pages>' in text:
+                    text = re.sub(r'<Pages>\d+</Pages>', f'<Pages>{pages}</Pages>', text)
+                else:
+                    text = text.replace('</Properties>', f'<Pages>{pages}</Pages></Properties>')
+                data = text.encode('utf-8')
+            dst.writestr(item, data)
+    os.replace(tmp_path, docx_path)
+
+
+def generate_docx(path, pages, headings_per_page, bookmarks_per_page, images, image_kb, tables,
+                  doc_id=''):
+    """
+    Tạo một DOCX tổng hợp theo các tham số corpus
+    doc_id được ghi vào nội dung để mỗi document khác nhau về bytes
+    (không thì PDF cache / coalescing trùng lặp sẽ làm sai số đo)
+    """
+    document = Document()
+    document.core_properties.identifier = doc_id
+    document.add_paragraph(f"Document {doc_id}")
+    bookmark_id = 0
+    image_pages = set(range(0, pages, max(1, pages // images))) if images else set()
+    table_pages = set(range(0, pages, max(1, pages // tables))) if tables else set()
+
+    for page in range(pages):
+        for h in range(headings_per_page):
+            heading = document.add_heading(f"Section {page + 1}.{h + 1}", level=1 if h == 0 else 2)
+            if bookmark_id < (page + 1) * bookmarks_per_page:
+                add_bookmark(heading, bookmark_id, f"bm_{bookmark_id}")
+                bookmark_id += 1
+        while bookmark_id < (page + 1) * bookmarks_per_page:
+            paragraph = document.add_paragraph(FILLER_TEXT)
+            add_bookmark(paragraph, bookmark_id, f"bm_{bookmark_id}")
+            bookmark_id += 1
+        document.add_paragraph(FILLER_TEXT)
+
+        if page in image_pages:
+            # Mỗi ảnh khác nhau, python-docx không dedupe nên weight đúng như cấu hình
+            image_path = path + f'.img{page}.png'
+            with open(image_path, 'wb') as f:
+                f.write(make_png(image_kb))
+            document.add_picture(image_path, width=Inches(3))
+            os.remove(image_path)
+
+        if page in table_pages:
+            table = document.add_table(rows=5, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"R{r + 1}C{c + 1}"
+
+        if page < pages - 1:
+            document.add_page_break()
+
+    document.save(path)
+    set_page_count(path, pages)
+    return path
+
+
+def generate_corpus(corpus_dir, profiles, docs_per_profile):
+    """Tạo corpus: một thư mục con cho mỗi profile"""
+    corpus = {}
+    for name in profiles:
+        spec = CORPUS_PROFILES[name]
+        profile_dir = os.path.join(corpus_dir, name)
+        os.makedirs(profile_dir, exist_ok=True)
+        version_file = os.path.join(profile_dir, '.corpus_version')
+        try:
+            with open(version_file) as f:
+                current = f.read().strip() == str(CORPUS_VERSION)
+        except OSError:
+            current = False
+        files = []
+        for n in range(docs_per_profile):
+            path = os.path.join(profile_dir, f"{name}_{n:03d}.docx")
+            if not current or not os.path.exists(path):
+                generate_docx(path, doc_id=f"{name}-{n:03d}", **spec)
+            files.append(path)
+        with open(version_file, 'w') as f:
+            f.write(f"{CORPUS_VERSION}\n")
+        corpus[name] = files
+        sizes = [os.path.getsize(f) for f in files]
+        logger.info(f"📄 Corpus '{name}': {len(files)} docs, avg {sum(sizes) / len(sizes) / 1024:.0f} KB")
+    return corpus
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "max": max(latencies) if latencies else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak RSS của benchmark process và của soffice child lớn nhất (MB)"""
+    try:
+        import resource
+    except ImportError:
+        return {"self": None, "children": None}
+    # ru_maxrss: KB trên Linux, bytes trên macOS
+    scale = 1024 * 1024 if platform.system() == 'Darwin' else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def measure_stages(converter, docx_path, work_dir, timeout=600):
+    """
+    Đo từng stage của một conversion bằng các building block của converter:
+    profile creation, soffice startup (--terminate_after_init), conversion, move
+    """
+    stages = {}
+
+    start = time.perf_counter()
+    user_installation = converter.create_worker_profile()
+    stages["profile_creation"] = time.perf_counter() - start
+
+    startup_cmd = [
+        converter.libreoffice_cmd, '--headless', '--invisible', '--nodefault',
+        '--nolockcheck', '--nologo', '--norestore', '--terminate_after_init',
+        f'-env:UserInstallation={user_installation}',
+    ]
+    start = time.perf_counter()
+    process = converter._spawn_soffice(startup_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        process.wait(timeout=timeout)
+    finally:
+        converter._terminate_soffice(process)
+    stages["soffice_startup"] = time.perf_counter() - start
+
+    convert_temp, temp_pdf_path = converter._new_convert_temp(docx_path)
+    try:
+        start = time.perf_counter()
+        converter._run_soffice_conversion([docx_path], convert_temp, timeout, user_installation)
+        subprocess_time = time.perf_counter() - start
+        stages["subprocess"] = subprocess_time
+        stages["conversion"] = max(0.0, subprocess_time - stages["soffice_startup"])
+
+        if not os.path.exists(temp_pdf_path):
+            stages["move"] = None
+            return stages
+        start = time.perf_counter()
+        shutil.move(temp_pdf_path, os.path.join(work_dir, os.path.basename(temp_pdf_path)))
+        stages["move"] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(convert_temp, ignore_errors=True)
+    return stages
+
+
+def benchmark_profile(converter, name, files, work_dir, max_workers, chunk_size, stage_samples):
+    """Benchmark convert_single_file, batch_convert và stage breakdown cho một profile"""
+    logger.info(f"🏁 Benchmarking '{name}' ({len(files)} docs)")
+    result = {"profile": name, "spec": CORPUS_PROFILES[name], "docs": len(files)}
+
+    # convert_single_file: latency từng document
+    single_dir = os.path.join(work_dir, name, "single")
+    os.makedirs(single_dir, exist_ok=True)
+    latencies = []
+    failures = 0
+    wall_start = time.perf_counter()
+    for path in files:
+        start = time.perf_counter()
+        ok = converter.convert_single_file(path, os.path.join(single_dir, Path(path).stem + '.pdf'))
+        elapsed = time.perf_counter() - start
+        if ok:
+            latencies.append(elapsed)
+        else:
+            failures += 1
+    wall = time.perf_counter() - wall_start
+    result["single"] = dict(
+        summarize(latencies),
+        failures=failures,
+        docs_per_minute=len(latencies) / wall * 60 if wall else None,
+    )
+
+    # batch_convert: throughput trên cả thư mục
+    batch_dir = os.path.join(work_dir, name, "batch")
+    start = time.perf_counter()
+    batch = converter.batch_convert(
+        os.path.dirname(files[0]), batch_dir, max_workers=max_workers, chunk_size=chunk_size,
+        coalesce_duplicates=False,
+    )
+    wall = time.perf_counter() - start
+    result["batch"] = {
+        "wall_time": wall,
+        "success": batch["success"],
+        "failed": batch["failed"],
+        "docs_per_minute": batch["success"] / wall * 60 if wall else None,
+        "max_workers": max_workers,
+        "chunk_size": chunk_size,
+    }
+
+    # Stage breakdown
+    stage_dir = os.path.join(work_dir, name, "stages")
+    os.makedirs(stage_dir, exist_ok=True)
+    samples = [measure_stages(converter, path, stage_dir) for path in files[:stage_samples]]
+    result["stages"] = {
+        stage: summarize([s[stage] for s in samples if s.get(stage) is not None])
+        for stage in ("profile_creation", "soffice_startup", "subprocess", "conversion", "move")
+    }
+
+    logger.info(
+        f"   p50 {result['single']['p50'] or 0:.2f}s, p95 {result['single']['p95'] or 0:.2f}s, "
+        f"batch {result['batch']['docs_per_minute'] or 0:.1f} docs/min"
+    )
+    return result
+
+
+def run_benchmark(profiles, docs_per_profile=5, corpus_dir=None, max_workers=1,
+                  chunk_size=1, pool_size=0, stage_samples=3, output_json="bench_results.json"):
+    """Chạy toàn bộ benchmark, ghi kết quả ra output_json và trả về dict kết quả"""
+    own_corpus = corpus_dir is None
+    corpus_dir = corpus_dir or tempfile.mkdtemp(prefix='docx_bench_corpus_')
+    work_dir = tempfile.mkdtemp(prefix='docx_bench_out_')
+
+    try:
+        corpus = generate_corpus(corpus_dir, profiles, docs_per_profile)
+
+        # Không dùng PDF cache / timing model / coalescing để kết quả phản ánh conversion thật
+        construct_start = time.perf_counter()
+        converter = DocxToPdfConverter(pool_size=pool_size, adaptive_timeout=False,
+                                       coalesce_inflight=False)
+        construct_time = time.perf_counter() - construct_start
+
+        with converter:
+            results = {
+                "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "host": {
+                    "platform": platform.platform(),
+                    "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(),
+                },
+                "libreoffice": {
+                    "command": converter.libreoffice_cmd,
+                    "version": converter.libreoffice_version,
+                    "supports_pdf_parameters": converter.supports_pdf_parameters,
+                },
+                "config": {
+                    "docs_per_profile": docs_per_profile,
+                    "max_workers": max_workers,
+                    "chunk_size": chunk_size,
+                    "pool_size": pool_size,
+                },
+                "converter_construction": construct_time,
+                "profiles": [
+                    benchmark_profile(converter, name, files, work_dir,
+                                      max_workers, chunk_size, stage_samples)
+                    for name, files in corpus.items()
+                ],
+            }
+        results["peak_rss_mb"] = peak_rss_mb()
+
+        with open(output_json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        logger.info(f"📊 Benchmark results written to {output_json}")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if own_corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark DOCX → PDF conversion throughput',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Quick run on small documents
+  python benchmark_converter.py --profiles letter --docs 10
+
+  # Compare parallel batch settings
+  python benchmark_converter.py --profiles letter,report --max-workers 8 --output bench_8w.json
+        """
+    )
+    parser.add_argument('--profiles', default='letter,report',
+                        help=f"Comma-separated corpus profiles ({', '.join(CORPUS_PROFILES)})")
+    parser.add_argument('--docs', type=int, default=5, help='Documents per profile')
+    parser.add_argument('--corpus-dir', help='Keep/reuse generated corpus in this directory')
+    parser.add_argument('--max-workers', type=int, default=1, help='batch_convert max_workers')
+    parser.add_argument('--chunk-size', type=int, default=1, help='batch_convert chunk_size')
+    parser.add_argument('--pool-size', type=int, default=0, help='LibreOffice worker pool size')
+    parser.add_argument('--stage-samples', type=int, default=3,
+                        help='Documents per profile used for the stage breakdown')
+    parser.add_argument('--output', default='bench_results.json', help='Result JSON file')
+
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    unknown = [p for p in profiles if p not in CORPUS_PROFILES]
+    if unknown:
+        print(f"❌ Unknown profiles: {', '.join(unknown)}")
+        return 1
+
+    run_benchmark(
+        profiles,
+        docs_per_profile=args.docs,
+        corpus_dir=args.corpus_dir,
+        max_workers=args.max_workers,
+        chunk_size=args.chunk_size,
+        pool_size=args.pool_size,
+        stage_samples=args.stage_samples,
+        output_json=args.output,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
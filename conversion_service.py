@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+HTTP service cho DOCX → PDF dùng một DocxToPdfConverter chạy lâu dài
+Queue có giới hạn (429 khi đầy), timeout theo từng request, /healthz và /metrics
+Upload trùng nội dung với job đang chờ/chạy dùng chung kết quả của job đó
+
+Endpoints:
+  POST /convert?timeout=60          body = DOCX bytes → PDF bytes
+  POST /convert?async=1             → 202 {"job_id": ...}
+  POST /convert?priority=bulk       → priority class cho soffice (interactive/normal/bulk)
+  POST /convert?pages=3             → preview: chỉ 3 trang đầu (hoặc pages=1-3,5)
+  GET  /jobs/<id>                   → trạng thái job (JSON)
+  GET  /jobs/<id>/pdf               → PDF khi job xong
+  GET  /healthz                     → 200 ok / 503 khi không có LibreOffice
+  GET  /metrics                     → Prometheus text format
+"""
+
+import os
+import sys
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import logging
+
+from docx_converter_fixed import (
+    PRIORITY_CLASSES,
+    DocxToPdfConverter,
+    PrometheusTextfileExporter,
+    hash_file,
+    link_or_copy,
+    normalize_page_range,
+    preflight_docx,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+# Thứ tự lấy job khỏi queue theo priority class (nhỏ hơn = trước); cùng class thì FIFO
+QUEUE_RANK = {'interactive': 0, None: 1, 'normal': 1, 'bulk': 2}
+
+
+class ConversionService:
+    """
+    Một converter dùng chung (probe cache, PDF cache, timing model, metrics),
+    N worker threads mỗi thread có profile LibreOffice riêng → tối đa N soffice cùng lúc
+    Job interactive được lấy khỏi queue trước job normal/bulk đang chờ
+    """
+
+    def __init__(self, workers=2, queue_size=8, default_timeout=None, max_timeout=600,
+                 max_upload_bytes=50 * 1024 * 1024, job_ttl=600, converter_kwargs=None):
+        self.workers = max(1, workers)
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.max_upload_bytes = max_upload_bytes
+        self.job_ttl = job_ttl
+        self.startup_error = None
+        try:
+            self.converter = DocxToPdfConverter(**(converter_kwargs or {}))
+        except SystemExit:
+            # DocxToPdfConverter gọi sys.exit khi không có LibreOffice: vẫn chạy để báo 503
+            self.converter = None
+            self.startup_error = "LibreOffice not found or not working"
+        self.exporter = (
+            PrometheusTextfileExporter(None, self.converter.metrics) if self.converter else None
+        )
+        self.jobs_dir = tempfile.mkdtemp(prefix='docx_service_')
+        self.jobs = {}
+        self.rejected = 0
+        self.coalesced = 0
+        self._active = {}  # SHA-256 input -> job đang queued/running
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        if self.converter is None:
+            logger.error(f"❌ Conversion service unavailable: {self.startup_error}")
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"convert-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🚀 Conversion service: {self.workers} workers, queue {self._queue.maxsize}")
+
+    def submit(self, data, timeout=None, priority_class=None, page_range=None):
+        """
+        Tạo job từ DOCX bytes
+        Returns: (job, None) hoặc (None, (http_status, error_dict))
+        """
+        if self.converter is None:
+            return None, (503, {"error": "unavailable", "detail": self.startup_error})
+        self._expire_jobs()
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.jobs_dir, f"{job_id}.docx")
+        with open(input_path, 'wb') as f:
+            f.write(data)
+
+        # Input hỏng bị từ chối ngay, không chiếm chỗ trong queue
+        preflight = preflight_docx(input_path)
+        if not preflight["ok"]:
+            os.remove(input_path)
+            return None, (422, {"error": preflight["reason"], "detail": preflight["detail"]})
+
+        if timeout is None:
+            timeout = self.default_timeout or self.converter.resolve_timeout(input_path)
+        timeout = min(float(timeout), self.max_timeout)
+        # Cùng nội dung nhưng khác page range là hai kết quả khác nhau
+        digest = f"{hash_file(input_path)}:{page_range or ''}"
+
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "input": input_path,
+            "output": os.path.join(self.jobs_dir, f"{job_id}.pdf"),
+            "timeout": timeout,
+            "priority": priority_class,
+            "page_range": page_range,
+            "enqueued_at": time.monotonic(),
+            # Timeout tính cả thời gian chờ trong queue
+            "deadline": time.monotonic() + timeout,
+            "created": time.time(),
+            "finished": None,
+            "error": None,
+            "hash": digest,
+            "coalesced_with": None,
+            "done": threading.Event(),
+        }
+
+        # Cùng nội dung với job đang chờ/chạy: dùng kết quả của job đó, không chiếm chỗ queue
+        with self._lock:
+            leader = self._active.get(digest)
+            if leader is not None and leader["priority"] == priority_class:
+                job["coalesced_with"] = leader["id"]
+                self.jobs[job_id] = job
+                self.coalesced += 1
+        if job["coalesced_with"]:
+            os.remove(input_path)
+            threading.Thread(target=self._follow, args=(leader, job), daemon=True).start()
+            return job, None
+
+        try:
+            self._queue.put_nowait(self._queue_item(QUEUE_RANK[priority_class], job))
+        except queue.Full:
+            os.remove(input_path)
+            with self._lock:
+                self.rejected += 1
+            return None, (429, {"error": "queue_full", "detail": "conversion queue is full"})
+        with self._lock:
+            self.jobs[job_id] = job
+            self._active[digest] = job
+        return job, None
+
+    def _queue_item(self, rank, job):
+        with self._lock:
+            self._sequence += 1
+            return (rank, self._sequence, job)
+
+    def _follow(self, leader, job):
+        """Chờ job leader xong rồi link/copy PDF của nó cho job trùng"""
+        leader["done"].wait()
+        try:
+            if leader["status"] == "done":
+                link_or_copy(leader["output"], job["output"])
+                job["status"] = "done"
+            else:
+                job["status"] = "failed"
+                job["error"] = leader["error"]
+        except OSError as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished"] = time.time()
+            job["done"].set()
+
+    def _worker(self):
+        profile_uri = self.converter.create_worker_profile()
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                break
+            try:
+                remaining = job["deadline"] - time.monotonic()
+                if remaining <= 0:
+                    job["status"] = "failed"
+                    job["error"] = "timeout"
+                    continue
+                job["status"] = "running"
+                success = self.converter.convert_single_file(
+                    job["input"], job["output"], remaining,
+                    priority_class=job["priority"],
+                    page_range=job["page_range"],
+                    user_installation=profile_uri,
+                    enqueued_at=job["enqueued_at"],
+                )
+                if success:
+                    job["status"] = "done"
+                else:
+                    job["status"] = "failed"
+                    job["error"] = "timeout" if time.monotonic() >= job["deadline"] else "conversion_failed"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished"] = time.time()
+                if os.path.exists(job["input"]):
+                    os.remove(job["input"])
+                with self._lock:
+                    if self._active.get(job["hash"]) is job:
+                        del self._active[job["hash"]]
+                job["done"].set()
+
+    def _expire_jobs(self):
+        """Xoá job đã xong quá job_ttl giây (cùng PDF của nó)"""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job["finished"] is not None and job["finished"] < cutoff]
+            for job_id in expired:
+                job = self.jobs.pop(job_id)
+                if os.path.exists(job["output"]):
+                    os.remove(job["output"])
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    @staticmethod
+    def describe(job):
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "error": job["error"],
+            "timeout": job["timeout"],
+            "priority": job["priority"],
+            "page_range": job["page_range"],
+            "coalesced_with": job["coalesced_with"],
+            "created": job["created"],
+            "finished": job["finished"],
+        }
+
+    def health(self):
+        """
+        Healthy khi có converter, executable LibreOffice vẫn còn đó và worker threads còn sống
+        (probe cache có thể trỏ tới bản LibreOffice đã bị gỡ)
+        """
+        error = self.startup_error
+        if error is None:
+            cmd = self.converter.libreoffice_cmd
+            if not (shutil.which(cmd) or os.path.exists(cmd)):
+                error = f"LibreOffice executable missing: {cmd}"
+            elif not all(thread.is_alive() for thread in self._threads):
+                error = "worker thread died"
+        healthy = error is None
+        return healthy, {
+            "status": "ok" if healthy else "unavailable",
+            "error": error,
+            "libreoffice": self.converter.libreoffice_version if self.converter else None,
+            "workers": sum(thread.is_alive() for thread in self._threads),
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+        }
+
+    def render_metrics(self):
+        """Metrics của converter + gauges của queue"""
+        with self._lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+            rejected = self.rejected
+            coalesced = self.coalesced
+        lines = [
+            "# TYPE docx_service_queue_depth gauge",
+            f"docx_service_queue_depth {self._queue.qsize()}",
+            "# TYPE docx_service_rejected_total counter",
+            f"docx_service_rejected_total {rejected}",
+            "# TYPE docx_service_coalesced_total counter",
+            f"docx_service_coalesced_total {coalesced}",
+            "# TYPE docx_service_jobs gauge",
+        ]
+        for status, count in sorted(statuses.items()):
+            lines.append(f'docx_service_jobs{{status="{status}"}} {count}')
+        converter_metrics = self.exporter.render() if self.exporter else ""
+        return converter_metrics + "\n".join(lines) + "\n"
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(self._queue_item(float('inf'), None))
+        for thread in self._threads:
+            thread.join()
+        if self.converter is not None:
+            self.converter.cleanup()
+        shutil.rmtree(self.jobs_dir, ignore_errors=True)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler; service nằm ở self.server.service"""
+
+    server_version = "DocxConverter/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_pdf(self, job):
+        with open(job["output"], 'rb') as f:
+            data = f.read()
+        self._send(200, data, 'application/pdf', {'X-Job-Id': job["id"]})
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlparse(self.path).path.rstrip('/')
+
+        if path == '/healthz':
+            healthy, info = service.health()
+            self._send(200 if healthy else 503, info)
+        elif path == '/metrics':
+            self._send(200, service.render_metrics(), 'text/plain; version=0.0.4')
+        elif path.startswith('/jobs/'):
+            parts = path.split('/')
+            job = service.get_job(parts[2])
+            if job is None:
+                self._send(404, {"error": "not_found"})
+            elif len(parts) == 4 and parts[3] == 'pdf':
+                if job["status"] == "done":
+                    self._send_pdf(job)
+                else:
+                    self._send(409, service.describe(job))
+            else:
+                self._send(200, service.describe(job))
+        else:
+            self._send(404, {"error": "not_found"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/convert':
+            self._send(404, {"error": "not_found"})
+            return
+
+        params = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send(400, {"error": "empty_body", "detail": "send DOCX bytes as request body"})
+            return
+        if length > service.max_upload_bytes:
+            self._send(413, {"error": "too_large", "detail": f"limit {service.max_upload_bytes} bytes"})
+            return
+
+        try:
+            timeout = float(params['timeout'][0]) if 'timeout' in params else None
+        except ValueError:
+            self._send(400, {"error": "bad_timeout"})
+            return
+
+        priority_class = params.get('priority', [None])[0]
+        if priority_class is not None and priority_class not in PRIORITY_CLASSES:
+            self._send(400, {"error": "bad_priority", "detail": f"one of {', '.join(PRIORITY_CLASSES)}"})
+            return
+
+        page_range = params.get('pages', [None])[0]
+        if page_range is not None:
+            try:
+                page_range = normalize_page_range(int(page_range) if page_range.isdigit() else page_range)
+            except ValueError:
+                self._send(400, {"error": "bad_pages", "detail": "N or a range like 1-3,5"})
+                return
+
+        job, error = service.submit(self.rfile.read(length), timeout, priority_class, page_range)
+        if error:
+            status, body = error
+            headers = {'Retry-After': '5'} if status == 429 else None
+            self._send(status, body, headers=headers)
+            return
+
+        if params.get('async', ['0'])[0] in ('1', 'true', 'yes'):
+            self._send(202, service.describe(job), headers={'Location': f"/jobs/{job['id']}"})
+            return
+
+        # Sync: chờ tới deadline của job (+ thời gian kill soffice)
+        job["done"].wait(job["timeout"] + 15)
+        if job["status"] == "done":
+            self._send_pdf(job)
+        elif job["status"] == "failed" and job["error"] != "timeout":
+            self._send(500, service.describe(job))
+        else:
+            self._send(504, service.describe(job))
+
+
+def run_server(host='127.0.0.1', port=8080, **service_kwargs):
+    """Chạy service tới khi Ctrl+C"""
+    service = ConversionService(**service_kwargs)
+    service.start()
+    server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    logger.info(f"🌐 Listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("🛑 Shutting down")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='DOCX → PDF HTTP conversion service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=2, help='Concurrent soffice conversions')
+    parser.add_argument('--queue-size', type=int, default=8, help='Pending jobs before 429')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Default per-request timeout (default: estimated from history)')
+    parser.add_argument('--max-timeout', type=float, default=600)
+    parser.add_argument('--pdf-cache-dir', help='Enable the content-addressed PDF cache')
+
+    args = parser.parse_args()
+
+    run_server(
+        args.host, args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        default_timeout=args.timeout,
+        max_timeout=args.max_timeout,
+        converter_kwargs={"pdf_cache_dir": args.pdf_cache_dir},
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
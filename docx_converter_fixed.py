@@ -6,14 +6,29 @@ Fixed version detection and Windows bootstrap.ini issues
 
 import os
 import sys
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import json
+import queue
+import re
+import select
+import struct
 import subprocess
 import shutil
 import tempfile
+import threading
 import time
 import uuid
+import zipfile
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
 import platform
+import signal
 
 # Setup logging
 logging.basicConfig(
@@ -22,39 +37,1988 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class DocxToPdfConverter:
+# PDF export options cho bookmark preservation (dùng cho JSON filter và UNO FilterData)
+PDF_EXPORT_OPTIONS = {
+    "ExportBookmarks": True,
+    "ExportBookmarksToNamedDestinations": True,
+    "UseTaggedPDF": True,
+}
+
+# registrymodifications.xcu với PDF export settings (cho profile-based workaround)
+PDF_EXPORT_REGISTRY_XCU = '''<?xml version="1.0" encoding="UTF-8"?>
+<oor:items xmlns:oor="http://openoffice.org/2001/registry" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <item oor:path="/org.openoffice.Office.Common/Filter/PDF/Export">
+    <prop oor:name="ExportBookmarks" oor:op="fuse">
+      <value>true</value>
+    </prop>
+    <prop oor:name="ExportBookmarksToNamedDestinations" oor:op="fuse">
+      <value>true</value>
+    </prop>
+    <prop oor:name="UseTaggedPDF" oor:op="fuse">
+      <value>true</value>
+    </prop>
+    <prop oor:name="ConvertOOoTargetToPDFTarget" oor:op="fuse">
+      <value>true</value>
+    </prop>
+    <prop oor:name="ExportLinksRelativeFsys" oor:op="fuse">
+      <value>false</value>
+    </prop>
+  </item>
+</oor:items>
+'''
+
+# Timeout mặc định khi chưa đủ lịch sử để ước lượng
+DEFAULT_CONVERSION_TIMEOUT = 180
+# Timeout tối thiểu theo số trang, kể cả khi lịch sử dự đoán thấp hơn
+TIMEOUT_SECONDS_PER_PAGE = 1.0
+
+# Shortest-job-first: giây/trang ước lượng khi timing model chưa đủ lịch sử
+SJF_SECONDS_PER_PAGE = 0.5
+
+# Priority classes cho soffice: nice, ionice (class 2 = best-effort + level, 3 = idle),
+# cgroup v2 cpu.weight/io.weight (1-10000) và priority class trên Windows
+PRIORITY_CLASSES = {
+    'interactive': {"nice": 0, "ionice_class": 2, "ionice_level": 0,
+                    "cpu_weight": 1000, "io_weight": 1000, "windows_flag": 0x00000020},
+    'normal': {"nice": 5, "ionice_class": 2, "ionice_level": 4,
+               "cpu_weight": 100, "io_weight": 100, "windows_flag": 0x00004000},
+    'bulk': {"nice": 19, "ionice_class": 3, "ionice_level": None,
+             "cpu_weight": 10, "io_weight": 10, "windows_flag": 0x00000040},
+}
+
+# Memory admission control
+MEMORY_RESERVE_BYTES = 512 * 1024 * 1024  # luôn chừa lại cho hệ thống
+DEFAULT_SOFFICE_FOOTPRINT = 400 * 1024 * 1024  # RSS ước lượng khi chưa đo được
+MEMORY_SAMPLE_INTERVAL = 0.25  # giây giữa hai lần đo RSS của process group soffice
+
+# Priority class của conversion đang chạy (theo thread / asyncio task)
+_priority_context = contextvars.ContextVar('docx_converter_priority', default=None)
+# PageRange của conversion đang chạy (None = cả tài liệu)
+_page_range_context = contextvars.ContextVar('docx_converter_page_range', default=None)
+PAGE_RANGE_PATTERN = re.compile(r'^(\d+(-\d*)?|-\d+)(,(\d+(-\d*)?|-\d+))*$')
+
+# Marker file đánh dấu template profile đã init xong
+PROFILE_TEMPLATE_MARKER = '.template_ready'
+# File ghi PID (+ start time) của process sở hữu profile, để dọn profile mồ côi
+PROFILE_OWNER_FILE = '.owner'
+# Profile không có owner file (bản cũ) chỉ bị coi là mồ côi khi đã cũ hơn mức này
+ORPHAN_PROFILE_MIN_AGE = 3600
+# Janitor quét profile mồ côi định kỳ (giây)
+JANITOR_SWEEP_INTERVAL = 600
+# Prefix của profile trong profile base, và của scratch dir ẩn đặt trong thư mục output
+PROFILE_DIR_PREFIXES = ('lo_profile_',)
+SCRATCH_DIR_PREFIXES = ('.docx_convert_', '.docx_chunk_')
+
+# Pre-flight DOCX: các part bắt buộc, giới hạn chống zip bomb
+DOCX_REQUIRED_PARTS = ('[Content_Types].xml', 'word/document.xml')
+PREFLIGHT_MAX_RATIO = 100  # tỉ lệ nén tối đa (uncompressed / compressed)
+PREFLIGHT_RATIO_MIN_BYTES = 10 * 1024 * 1024  # chỉ xét tỉ lệ khi giải nén lớn hơn mức này
+PREFLIGHT_MAX_UNCOMPRESSED = 1024 ** 3
+OLE_HEADER = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # DOCX có password = OLE compound file
+
+# RAM-backed staging (tmpfs) cho scratch dirs và profiles
+RAM_STAGING_CANDIDATES = ('/dev/shm', '/run/shm')
+# Luôn chừa lại chừng này dung lượng trống trên tmpfs (tmpfs ăn vào RAM)
+STAGING_MIN_FREE_BYTES = 256 * 1024 * 1024
+# Scratch space ước lượng cho một file = size DOCX * hệ số (PDF + file tạm của soffice)
+STAGING_SIZE_FACTOR = 4
+
+
+def default_cache_dir():
+    """Thư mục cache on-disk của converter (có thể override bằng DOCX_CONVERTER_CACHE_DIR)"""
+    cache_dir = os.environ.get('DOCX_CONVERTER_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+    if platform.system().lower() == 'windows':
+        root = os.environ.get('LOCALAPPDATA') or tempfile.gettempdir()
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'docx_converter')
+
+
+def free_bytes(path):
+    """Dung lượng trống của filesystem chứa path (0 nếu không đọc được)"""
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def same_filesystem(path_a, path_b):
+    """True nếu hai path nằm trên cùng filesystem (move giữa chúng chỉ là rename)"""
+    try:
+        return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+    except OSError:
+        return False
+
+
+def find_staging_dir(staging_dir='auto', min_free=STAGING_MIN_FREE_BYTES):
+    """
+    Chọn thư mục staging: 'auto' = tmpfs đầu tiên có sẵn (/dev/shm, /run/shm),
+    hoặc path cụ thể. Trả về None nếu không dùng được (ghi được + đủ dung lượng trống)
+    """
+    candidates = RAM_STAGING_CANDIDATES if staging_dir == 'auto' else (staging_dir,)
+    for candidate in candidates:
+        if not os.path.isdir(candidate) or not os.access(candidate, os.W_OK):
+            continue
+        if free_bytes(candidate) < min_free:
+            logger.warning(f"⚠️  Staging dir {candidate} has less than {min_free:,} bytes free")
+            continue
+        return candidate
+    return None
+
+
+def write_json_atomic(path, data):
+    """Ghi JSON qua file tạm + rename để reader không bao giờ thấy file dở dang"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+_jsonl_lock = threading.Lock()
+
+
+def append_jsonl(path, record):
+    """Append một JSON record vào file JSONL (thread-safe, flush ngay)"""
+    line = json.dumps(record, ensure_ascii=False)
+    with _jsonl_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+
+
+def build_pdf_filter_string(options):
+    """Tạo chuỗi --convert-to với JSON parameters (LibreOffice 7.3+)"""
+    params = {}
+    for name, value in options.items():
+        if isinstance(value, bool):
+            params[name] = {"type": "boolean", "value": "true" if value else "false"}
+        elif isinstance(value, int):
+            params[name] = {"type": "long", "value": str(value)}
+        else:
+            params[name] = {"type": "string", "value": str(value)}
+    return 'pdf:writer_pdf_Export:' + json.dumps(params, separators=(',', ':'))
+
+
+def normalize_page_range(page_range):
+    """
+    PageRange cho writer_pdf_Export: int N = N trang đầu, hoặc chuỗi kiểu '1-3,5,8-'
+    Returns: chuỗi đã chuẩn hoá, None nếu không giới hạn
+    """
+    if page_range is None:
+        return None
+    if isinstance(page_range, int):
+        if page_range < 1:
+            raise ValueError(f"Invalid page count: {page_range}")
+        return f"1-{page_range}"
+    normalized = str(page_range).replace(' ', '').replace(';', ',')
+    if not PAGE_RANGE_PATTERN.match(normalized):
+        raise ValueError(f"Invalid page range: {page_range}")
+    for part in normalized.split(','):
+        start, _, end = part.partition('-')
+        if start and end and int(start) > int(end):
+            raise ValueError(f"Invalid page range: {page_range} ({part} is reversed)")
+        if (start and int(start) == 0) or (end and int(end) == 0):
+            raise ValueError(f"Invalid page range: {page_range} (pages start at 1)")
+    return normalized
+
+
+def page_range_indices(page_range, page_count):
+    """Index (0-based) các trang thuộc page_range, theo thứ tự, không trùng"""
+    indices = []
+    for part in page_range.split(','):
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start = int(start) if start else 1
+            end = int(end) if end else page_count
+        else:
+            start = end = int(part)
+        for page in range(max(start, 1), min(end, page_count) + 1):
+            if page - 1 not in indices:
+                indices.append(page - 1)
+    return indices
+
+
+def count_pdf_pages(pdf_path):
+    """Số trang của PDF (PyPDF2); None nếu không đọc được"""
+    try:
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    except Exception:
+        return None
+
+
+def trim_pdf_pages(pdf_path, page_range):
+    """
+    Giữ lại các trang trong page_range (PyPDF2), ghi đè pdf_path
+    Dùng khi soffice không nhận được PageRange (LibreOffice cũ, profile-based export)
+    """
+    import PyPDF2
+
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        indices = page_range_indices(page_range, len(reader.pages))
+        if not indices:
+            raise ValueError(f"Page range {page_range} selects no pages "
+                             f"(document has {len(reader.pages)})")
+        if len(indices) == len(reader.pages):
+            return len(indices)
+        writer = PyPDF2.PdfWriter()
+        for index in indices:
+            writer.add_page(reader.pages[index])
+        tmp_path = f"{pdf_path}.trim"
+        with open(tmp_path, 'wb') as out:
+            writer.write(out)
+    os.replace(tmp_path, pdf_path)
+    return len(indices)
+
+
+def popen_process_group(cmd, **kwargs):
+    """Start process trong process group riêng để có thể terminate cả cây process"""
+    if platform.system().lower() == 'windows':
+        kwargs.setdefault('creationflags', subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs.setdefault('start_new_session', True)
+    return subprocess.Popen(cmd, **kwargs)
+
+
+def priority_command(cmd, priority_class, cgroup_dir=None):
+    """
+    Bọc command để process (và mọi process con của nó) chạy với nice/ionice của priority class
+    cgroup_dir: shell wrapper tự ghi pid vào cgroup.procs trước khi exec nên không bị race
+    với các process con mà soffice fork ra
+    """
+    if not priority_class or platform.system().lower() == 'windows':
+        return list(cmd)
+    settings = PRIORITY_CLASSES[priority_class]
+    prefix = []
+    if cgroup_dir:
+        prefix += ['/bin/sh', '-c', 'echo $$ > "$0" 2>/dev/null; exec "$@"',
+                   os.path.join(cgroup_dir, 'cgroup.procs')]
+    if settings["nice"] and shutil.which('nice'):
+        prefix += ['nice', '-n', str(settings["nice"])]
+    if shutil.which('ionice'):
+        # -t: bỏ qua lỗi (container không cho ioprio_set) thay vì không chạy command
+        prefix += ['ionice', '-t', '-c', str(settings["ionice_class"])]
+        if settings["ionice_level"] is not None:
+            prefix += ['-n', str(settings["ionice_level"])]
+    return prefix + list(cmd)
+
+
+def rlimit_command(cmd, memory_limit):
+    """Giới hạn address space (RLIMIT_AS) của soffice qua prlimit (util-linux), giữ được qua exec"""
+    if not shutil.which('prlimit'):
+        logger.debug("prlimit not found, memory limit not applied")
+        return list(cmd)
+    return ['prlimit', f'--as={int(memory_limit)}', '--'] + list(cmd)
+
+
+def create_memory_cgroup(parent_dir, memory_limit):
+    """
+    Tạo cgroup v2 leaf với memory.max cho một soffice process (tắt swap cho nó nếu được)
+    Returns: thư mục cgroup, None nếu không tạo được
+    """
+    try:
+        with open(os.path.join(parent_dir, 'cgroup.subtree_control'), 'w') as f:
+            f.write('+memory')
+    except OSError as e:
+        logger.debug(f"Cannot enable memory controller in {parent_dir}: {e}")
+    leaf = os.path.join(parent_dir, f"conv_{uuid.uuid4().hex[:8]}")
+    try:
+        os.makedirs(leaf)
+        with open(os.path.join(leaf, 'memory.max'), 'w') as f:
+            f.write(str(int(memory_limit)))
+    except OSError as e:
+        logger.warning(f"⚠️  Cannot create memory cgroup: {e}")
+        remove_cgroup(leaf)
+        return None
+    try:
+        with open(os.path.join(leaf, 'memory.swap.max'), 'w') as f:
+            f.write('0')
+    except OSError:
+        pass
+    return leaf
+
+
+def remove_cgroup(cgroup_dir):
+    """Xoá cgroup leaf (chỉ thành công khi không còn process nào trong đó)"""
+    try:
+        os.rmdir(cgroup_dir)
+    except OSError as e:
+        logger.debug(f"Cannot remove cgroup {cgroup_dir}: {e}")
+
+
+def read_mem_available():
+    """MemAvailable (bytes) từ /proc/meminfo; None nếu không đọc được (non-Linux)"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def process_group_rss(pgid):
+    """Tổng RSS (bytes) của các process trong process group (soffice + soffice.bin)"""
+    try:
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        pids = os.listdir('/proc')
+    except (AttributeError, ValueError, OSError):
+        return 0
+    total = 0
+    for pid in pids:
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        # Sau "(comm)": state ppid pgrp ... rss là field thứ 22 tính từ state
+        fields = data[data.rfind(b')') + 2:].split()
+        try:
+            if int(fields[2]) == pgid:
+                total += int(fields[21]) * page_size
+        except (IndexError, ValueError):
+            continue
+    return total
+
+
+class MemoryAdmissionController:
+    """
+    Chỉ cho conversion mới start khi MemAvailable còn đủ cho footprint ước lượng + reserve
+    Footprint = percentile cao của peak RSS đo được ở các conversion trước.
+    Conversion đang chạy chưa ramp-up hết được trừ phần footprint còn thiếu
+    Dùng chung giữa các converter trong process (xem shared_memory_admission)
+    """
+
+    def __init__(self, reserve_bytes=MEMORY_RESERVE_BYTES, default_footprint=DEFAULT_SOFFICE_FOOTPRINT,
+                 max_samples=50, percentile=0.9, poll_interval=0.5, max_wait=120):
+        self.reserve_bytes = reserve_bytes
+        self.default_footprint = default_footprint
+        self.max_samples = max_samples
+        self.percentile = percentile
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.samples = []
+        self._tickets = {}
+        self._cond = threading.Condition()
+
+    def estimate(self):
+        """Footprint dự kiến (bytes) của một soffice conversion"""
+        with self._cond:
+            if not self.samples:
+                return self.default_footprint
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def _headroom(self, available):
+        ramping = sum(max(0, t["estimate"] - t["rss"]) for t in self._tickets.values())
+        return available - self.reserve_bytes - ramping
+
+    def acquire(self):
+        """
+        Chờ tới khi đủ bộ nhớ; trả về (ticket, số giây đã chờ)
+        Luôn admit khi không có conversion nào đang chạy trong process này, hoặc khi
+        chờ quá max_wait (bộ nhớ bị process khác chiếm), để không bao giờ treo
+        """
+        estimate = self.estimate()
+        start = time.monotonic()
+        logged = False
+        with self._cond:
+            while self._tickets:
+                available = read_mem_available()
+                if available is None or self._headroom(available) >= estimate:
+                    break
+                if self.max_wait is not None and time.monotonic() - start >= self.max_wait:
+                    logger.warning("⚠️  Memory still low after waiting, admitting conversion anyway")
+                    break
+                if not logged:
+                    logger.info(
+                        f"🧠 Waiting for memory: {available // 2**20} MiB available, "
+                        f"need {(estimate + self.reserve_bytes) // 2**20} MiB"
+                    )
+                    logged = True
+                self._cond.wait(self.poll_interval)
+            ticket = uuid.uuid4().hex
+            self._tickets[ticket] = {"estimate": estimate, "rss": 0}
+        return ticket, time.monotonic() - start
+
+    def update(self, ticket, rss):
+        """Ghi nhận RSS hiện tại của conversion"""
+        with self._cond:
+            entry = self._tickets.get(ticket)
+            if entry is not None and rss > entry["rss"]:
+                entry["rss"] = rss
+
+    def release(self, ticket):
+        """Conversion xong: lưu peak RSS làm mẫu footprint và đánh thức các conversion đang chờ"""
+        with self._cond:
+            entry = self._tickets.pop(ticket, None)
+            if entry is not None and entry["rss"] > 0:
+                self.samples.append(entry["rss"])
+                self.samples = self.samples[-self.max_samples:]
+            self._cond.notify_all()
+
+
+_shared_memory_admission = None
+_shared_memory_admission_lock = threading.Lock()
+
+
+def shared_memory_admission():
+    """MemoryAdmissionController dùng chung cho mọi converter trong process"""
+    global _shared_memory_admission
+    with _shared_memory_admission_lock:
+        if _shared_memory_admission is None:
+            _shared_memory_admission = MemoryAdmissionController()
+        return _shared_memory_admission
+
+
+def sample_process_group_rss(pgid, callback, stop_event, interval=MEMORY_SAMPLE_INTERVAL):
+    """Đo RSS của process group định kỳ tới khi stop_event được set"""
+    while not stop_event.wait(interval):
+        callback(process_group_rss(pgid))
+
+
+def setup_priority_cgroups(cgroup_root):
+    """
+    Tạo cgroup v2 con cho từng priority class dưới cgroup_root (cần được delegate/ghi được)
+    Returns: dict class -> thư mục cgroup ({} nếu không dùng được)
+    """
+    try:
+        with open(os.path.join(cgroup_root, 'cgroup.subtree_control'), 'w') as f:
+            f.write('+cpu +io')
+    except OSError as e:
+        logger.debug(f"Cannot enable cpu/io controllers in {cgroup_root}: {e}")
+    groups = {}
+    for name, settings in PRIORITY_CLASSES.items():
+        group_dir = os.path.join(cgroup_root, name)
+        try:
+            os.makedirs(group_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"⚠️  cgroup priority classes disabled: {e}")
+            return {}
+        for control, value in (('cpu.weight', settings["cpu_weight"]),
+                               ('io.weight', f"default {settings['io_weight']}")):
+            try:
+                with open(os.path.join(group_dir, control), 'w') as f:
+                    f.write(str(value))
+            except OSError as e:
+                logger.debug(f"Cannot set {control} for {name}: {e}")
+        groups[name] = group_dir
+    return groups
+
+
+def terminate_process_group(process, grace=10):
+    """
+    Terminate process group của một process đã start bằng popen_process_group
+    Gửi SIGTERM, chờ process thoát tối đa `grace` giây rồi mới SIGKILL
+    """
+    if platform.system().lower() == 'windows':
+        if process.poll() is None:
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           capture_output=True, timeout=10)
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        return
+
+    # Leader có thể đã thoát nhưng các process con (soffice.bin) vẫn còn trong group
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.wait()
+
+
+def reflink_file(src, dst):
+    """Tạo bản copy-on-write (FICLONE) của src; trả về False nếu filesystem không hỗ trợ"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def clone_file(src, dst):
+    """
+    Copy file bằng reflink (copy-on-write) nếu filesystem hỗ trợ, fallback copy thường
+    """
+    if not reflink_file(src, dst):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst):
+    """Đưa src tới dst bằng reflink, hardlink, hoặc copy (theo thứ tự ưu tiên)"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if reflink_file(src, dst):
+        return 'reflink'
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 của nội dung file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PdfConversionCache:
+    """
+    Content-addressed cache cho PDF output
+    Key = hash nội dung DOCX + PDF filter options; store giới hạn dung lượng, LRU eviction
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(docx_path, filter_signature):
+        digest = hashlib.sha256()
+        digest.update(hash_file(docx_path).encode('ascii'))
+        digest.update(b'\0')
+        digest.update(filter_signature.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pdf'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def fetch(self, key, output_path):
+        """Đưa PDF đã cache tới output_path; trả về True nếu cache hit"""
+        entry = self._entry_path(key)
+        try:
+            # mtime dùng làm thời điểm truy cập cho LRU
+            os.utime(entry)
+            # Reflink hoặc copy, không hardlink: output bị sửa sẽ làm hỏng entry trong cache
+            # và dung lượng entry vẫn bị chiếm sau khi evict
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            clone_file(entry, output_path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, pdf_path):
+        """Lưu PDF vào cache rồi evict các entry ít dùng nhất nếu vượt max_bytes"""
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_entry = f"{entry}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            # Không hardlink vào cache: output có thể bị sửa sau đó
+            clone_file(pdf_path, tmp_entry)
+            os.replace(tmp_entry, entry)
+        except OSError as e:
+            if os.path.exists(tmp_entry):
+                os.remove(tmp_entry)
+            logger.debug(f"Cannot store PDF in cache: {e}")
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += os.path.getsize(entry)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+                return
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
+
+    def stats(self):
+        entries = list(self._entries())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+def clone_directory(src_dir, dst_dir):
+    """
+    Clone cây thư mục bằng reflink/copy
+    Không dùng hardlink vì LibreOffice ghi đè file trong profile, sẽ làm hỏng template
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir)
+        target_root = dst_dir if rel == '.' else os.path.join(dst_dir, rel)
+        for name in dirs:
+            os.makedirs(os.path.join(target_root, name), exist_ok=True)
+        for name in files:
+            if name == PROFILE_TEMPLATE_MARKER:
+                continue
+            src = os.path.join(root, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), os.path.join(target_root, name))
+            else:
+                clone_file(src, os.path.join(target_root, name))
+
+
+# Profiles/scratch dirs đang được converter trong process này dùng: janitor không bao giờ xoá
+_live_profiles = set()
+_live_profiles_lock = threading.Lock()
+
+# Windows: OpenProcess access right và exit code của process còn chạy
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_STILL_ACTIVE = 259
+
+
+def _windows_open_process(pid):
+    """Handle (query) của process trên Windows; (None, error code) nếu không mở được"""
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return kernel32, None, ctypes.get_last_error()
+    return kernel32, handle, 0
+
+
+def _process_start_time(pid):
+    """
+    Start time của process, để phân biệt PID bị tái sử dụng
+    Linux: /proc/<pid>/stat, Windows: creation time (GetProcessTimes); None nếu không đọc được
+    """
+    if platform.system().lower() == 'windows':
+        try:
+            import ctypes
+            from ctypes import wintypes
+            kernel32, handle, _ = _windows_open_process(pid)
+            if handle is None:
+                return None
+            try:
+                times = [wintypes.FILETIME() for _ in range(4)]
+                if not kernel32.GetProcessTimes(handle, *[ctypes.byref(t) for t in times]):
+                    return None
+                return str((times[0].dwHighDateTime << 32) | times[0].dwLowDateTime)
+            finally:
+                kernel32.CloseHandle(handle)
+        except (ImportError, OSError, AttributeError):
+            return None
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # comm có thể chứa khoảng trắng: các field sau dấu ')' cuối cùng
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _pid_alive(pid):
+    """Process còn sống không; None nếu không xác định được"""
+    if platform.system().lower() == 'windows':
+        # os.kill(pid, 0) trên Windows sẽ kill process: dùng OpenProcess/GetExitCodeProcess
+        try:
+            import ctypes
+            from ctypes import wintypes
+            kernel32, handle, error = _windows_open_process(pid)
+            if handle is None:
+                # ERROR_ACCESS_DENIED: process của user khác vẫn đang chạy
+                return error == 5
+            try:
+                code = wintypes.DWORD()
+                if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                    return None
+                return code.value == _STILL_ACTIVE
+            finally:
+                kernel32.CloseHandle(handle)
+        except (ImportError, OSError, AttributeError):
+            return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Process của user khác vẫn đang sống
+    return True
+
+
+def write_profile_owner(profile_dir):
+    """Ghi PID của process hiện tại vào profile"""
+    pid = os.getpid()
+    with open(os.path.join(profile_dir, PROFILE_OWNER_FILE), 'w') as f:
+        f.write(f"{pid} {_process_start_time(pid) or ''}\n")
+
+
+def register_live_profile(profile_dir):
+    with _live_profiles_lock:
+        _live_profiles.add(os.path.abspath(profile_dir))
+
+
+def unregister_live_profile(profile_dir):
+    with _live_profiles_lock:
+        _live_profiles.discard(os.path.abspath(profile_dir))
+
+
+def touch_live_profiles():
+    """
+    Heartbeat: cập nhật mtime owner file của các profile đang dùng, để process khác
+    không xác định được PID (vd không có quyền) vẫn thấy profile còn được dùng
+    """
+    with _live_profiles_lock:
+        profiles = list(_live_profiles)
+    for profile_dir in profiles:
+        try:
+            os.utime(os.path.join(profile_dir, PROFILE_OWNER_FILE))
+        except OSError:
+            pass
+
+
+def profile_owner_alive(profile_dir):
+    """
+    Process tạo profile còn sống không
+    Returns: True/False, hoặc None khi profile không có owner file
+    """
+    try:
+        with open(os.path.join(profile_dir, PROFILE_OWNER_FILE), 'r') as f:
+            fields = f.read().split()
+        pid = int(fields[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    alive = _pid_alive(pid)
+    if alive and len(fields) > 1:
+        return _process_start_time(pid) in (None, fields[1])
+    return alive
+
+
+def find_orphaned_profiles(profile_base, min_age=ORPHAN_PROFILE_MIN_AGE, prefixes=PROFILE_DIR_PREFIXES):
+    """
+    Thư mục (lo_profile_* hoặc prefixes truyền vào) mà process tạo ra nó đã chết; không xác
+    định được owner thì theo tuổi của heartbeat (mtime owner file, hoặc của thư mục nếu
+    không có owner file)
+    Thư mục đang được converter trong process này dùng không bao giờ bị tính là mồ côi
+    """
+    orphans = []
+    try:
+        names = os.listdir(profile_base)
+    except OSError:
+        return orphans
+    with _live_profiles_lock:
+        live = set(_live_profiles)
+    now = time.time()
+    for name in names:
+        if not name.startswith(prefixes):
+            continue
+        profile_dir = os.path.join(profile_base, name)
+        if os.path.abspath(profile_dir) in live:
+            continue
+        alive = profile_owner_alive(profile_dir)
+        if alive is None:
+            owner_file = os.path.join(profile_dir, PROFILE_OWNER_FILE)
+            try:
+                heartbeat = os.path.getmtime(owner_file if os.path.exists(owner_file) else profile_dir)
+            except OSError:
+                continue
+            alive = now - heartbeat < min_age
+        if not alive:
+            orphans.append(profile_dir)
+    return orphans
+
+
+class BackgroundJanitor:
+    """
+    Xoá thư mục tạm/profiles ở background thread để teardown filesystem
+    không nằm trong latency của request
+    Định kỳ quét các thư mục profile đã đăng ký để dọn profile mồ côi (process crash),
+    và các thư mục output có scratch dir ẩn (.docx_convert_*, .docx_chunk_*)
+    """
+    
+    def __init__(self, sweep_interval=JANITOR_SWEEP_INTERVAL, orphan_min_age=ORPHAN_PROFILE_MIN_AGE):
+        self.sweep_interval = sweep_interval
+        self.orphan_min_age = orphan_min_age
+        self.removed = 0
+        self.orphans_reclaimed = 0
+        self._queue = queue.Queue()
+        # Thư mục được quét → prefix của các entry có thể bị dọn
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='docx-janitor', daemon=True)
+                self._thread.start()
+    
+    def discard(self, path):
+        """Xếp hàng xoá path (file hoặc thư mục)"""
+        if path:
+            self._ensure_thread()
+            self._queue.put(path)
+    
+    def _watch(self, directory, prefixes):
+        with self._lock:
+            if directory in self._watched:
+                return
+            self._watched[directory] = prefixes
+        self._ensure_thread()
+        self._queue.put(('sweep', directory, prefixes))
+    
+    def watch_profile_base(self, profile_base):
+        """Đăng ký thư mục profile để quét mồ côi (quét ngay lần đầu)"""
+        self._watch(profile_base, PROFILE_DIR_PREFIXES)
+    
+    def watch_scratch_dir(self, output_dir):
+        """Đăng ký thư mục output chứa scratch dir ẩn để quét mồ côi (quét ngay lần đầu)"""
+        self._watch(output_dir, SCRATCH_DIR_PREFIXES)
+    
+    def sweep(self, profile_base, prefixes=PROFILE_DIR_PREFIXES):
+        """Xoá các profile (hoặc scratch dir theo prefixes) mồ côi trong profile_base"""
+        touch_live_profiles()
+        for profile_dir in find_orphaned_profiles(profile_base, self.orphan_min_age, prefixes):
+            self._remove(profile_dir)
+            self.orphans_reclaimed += 1
+            logger.info(f"🧹 Reclaimed orphaned directory: {profile_dir}")
+    
+    def _remove(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.debug(f"Janitor cannot remove {path}: {e}")
+        self.removed += 1
+    
+    def _sweep_all(self):
+        with self._lock:
+            watched = list(self._watched.items())
+        for directory, prefixes in watched:
+            self.sweep(directory, prefixes)
+    
+    def _run(self):
+        last_sweep = time.monotonic()
+        while True:
+            # Sweep (kèm heartbeat) theo thời gian, kể cả khi queue không bao giờ rỗng
+            wait = max(0.0, last_sweep + self.sweep_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                self._sweep_all()
+                last_sweep = time.monotonic()
+                continue
+            try:
+                if isinstance(item, tuple):
+                    self.sweep(item[1], item[2])
+                else:
+                    self._remove(item)
+            except Exception as e:
+                logger.debug(f"Janitor error: {e}")
+            finally:
+                self._queue.task_done()
+    
+    def flush(self, timeout=None):
+        """Chờ các path đã xếp hàng được xoá xong"""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+_shared_janitor = None
+_shared_janitor_lock = threading.Lock()
+
+
+def shared_janitor():
+    """BackgroundJanitor dùng chung cho mọi converter trong process"""
+    global _shared_janitor
+    with _shared_janitor_lock:
+        if _shared_janitor is None:
+            _shared_janitor = BackgroundJanitor()
+            # Thread là daemon: xoá nốt những gì còn trong queue trước khi thoát
+            atexit.register(_shared_janitor.flush, 30)
+        return _shared_janitor
+
+
+def read_docx_page_count(docx_path):
+    """Đọc số trang từ docProps/app.xml (Word lưu khi save); None nếu không có"""
+    try:
+        with zipfile.ZipFile(docx_path) as archive:
+            app_xml = archive.read('docProps/app.xml').decode('utf-8', errors='ignore')
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return None
+    match = re.search(r'<(?:\w+:)?Pages>(\d+)</(?:\w+:)?Pages>', app_xml)
+    return int(match.group(1)) if match else None
+
+
+def scan_pdf_outline(pdf_path, max_titles=10):
+    """
+    Đếm bookmarks (outline items, mọi cấp) và named destinations của PDF
+    Chỉ đọc trailer → catalog → outline tree / name tree, không đụng tới pages hay content streams
+    PyPDF2 resolve object lazily qua xref nên chi phí không phụ thuộc số trang
+
+    Returns:
+        dict: outline_items, top_level, max_depth, named_destinations,
+              titles (list (depth, title) của max_titles item đầu tiên)
+    """
+    import PyPDF2
+    from PyPDF2.generic import IndirectObject
+
+    def resolve(obj):
+        return obj.get_object() if isinstance(obj, IndirectObject) else obj
+
+    def identity(obj):
+        # Indirect ref → (idnum, generation); direct object → id() để vẫn chặn được cycle
+        if isinstance(obj, IndirectObject):
+            return (obj.idnum, obj.generation)
+        return id(obj)
+
+    result = {
+        "outline_items": 0,
+        "top_level": 0,
+        "max_depth": 0,
+        "named_destinations": 0,
+        "titles": [],
+    }
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        catalog = resolve(reader.trailer['/Root'])
+
+        # Outline tree: duyệt /First → /Next theo thứ tự hiển thị (con trước, anh em sau)
+        outlines = resolve(catalog.get('/Outlines'))
+        seen = set()
+        stack = []
+        if outlines is not None and '/First' in outlines:
+            stack.append((outlines.raw_get('/First'), 1))
+        while stack:
+            ref, depth = stack.pop()
+            key = identity(ref)
+            if key in seen:
+                continue  # PDF hỏng: outline có vòng lặp
+            seen.add(key)
+            item = resolve(ref)
+            result["outline_items"] += 1
+            result["max_depth"] = max(result["max_depth"], depth)
+            if depth == 1:
+                result["top_level"] += 1
+            if len(result["titles"]) < max_titles:
+                result["titles"].append((depth, str(item.get('/Title', ''))))
+            if '/Next' in item:
+                stack.append((item.raw_get('/Next'), depth))
+            if '/First' in item:
+                stack.append((item.raw_get('/First'), depth + 1))
+
+        # Named destinations: name tree /Root /Names /Dests (PDF 1.2+)
+        names = resolve(catalog.get('/Names'))
+        if names is not None and '/Dests' in names:
+            seen = set()
+            stack = [names.raw_get('/Dests')]
+            while stack:
+                ref = stack.pop()
+                key = identity(ref)
+                if key in seen:
+                    continue
+                seen.add(key)
+                node = resolve(ref)
+                if '/Names' in node:
+                    # Mảng [key1 value1 key2 value2 ...]
+                    result["named_destinations"] += len(resolve(node['/Names'])) // 2
+                if '/Kids' in node:
+                    stack.extend(resolve(node.raw_get('/Kids')))
+
+        # Named destinations kiểu cũ: dictionary /Root /Dests (PDF 1.1)
+        dests = resolve(catalog.get('/Dests'))
+        if dests is not None:
+            result["named_destinations"] += len(dests)
+
+    return result
+
+
+class DocxPreflightError(ValueError):
+    """DOCX bị preflight_docx từ chối; result chứa reason/detail"""
+
+    def __init__(self, result):
+        super().__init__(f"{result['reason']}: {result['detail']}")
+        self.result = result
+        self.reason = result['reason']
+
+
+def preflight_docx(docx_path, verify_crc=True, max_ratio=PREFLIGHT_MAX_RATIO,
+                   max_uncompressed=PREFLIGHT_MAX_UNCOMPRESSED):
+    """
+    Kiểm tra nhanh DOCX trước khi launch soffice (chỉ đọc central directory)
+
+    Checks: file ZIP đọc được central directory (không bị cắt cụt), có các part bắt buộc,
+    không bị mã hoá (OLE container hoặc ZIP encryption flag), không phải zip bomb,
+    CRC của các part bắt buộc (chỉ giải nén những part đó, đọc theo chunk)
+
+    Returns:
+        dict: ok, reason (None | not_found | not_zip | encrypted | truncated |
+              missing_part | zip_bomb | crc_mismatch), detail, entries, uncompressed_bytes
+    """
+    result = {"ok": False, "reason": None, "detail": "", "entries": 0, "uncompressed_bytes": 0}
+
+    def fail(reason, detail):
+        result["reason"] = reason
+        result["detail"] = detail
+        return result
+
+    try:
+        file_size = os.path.getsize(docx_path)
+        with open(docx_path, 'rb') as f:
+            header = f.read(8)
+    except OSError as e:
+        return fail('not_found', str(e))
+
+    if header == OLE_HEADER:
+        return fail('encrypted', "password-protected Office document (OLE container)")
+    if not header.startswith(b'PK\x03\x04'):
+        return fail('not_zip', "missing ZIP local file header")
+
+    try:
+        with zipfile.ZipFile(docx_path) as archive:
+            infos = archive.infolist()
+            result["entries"] = len(infos)
+            names = {info.filename for info in infos}
+            for part in DOCX_REQUIRED_PARTS:
+                if part not in names:
+                    return fail('missing_part', f"{part} not found")
+
+            total_compressed = 0
+            total_uncompressed = 0
+            for info in infos:
+                if info.flag_bits & 0x1:
+                    return fail('encrypted', f"{info.filename} is encrypted")
+                if info.header_offset + info.compress_size > file_size:
+                    return fail('truncated', f"{info.filename} extends past end of file")
+                total_compressed += info.compress_size
+                total_uncompressed += info.file_size
+            result["uncompressed_bytes"] = total_uncompressed
+
+            if total_uncompressed > max_uncompressed:
+                return fail('zip_bomb', f"{total_uncompressed:,} bytes uncompressed")
+            if (total_uncompressed > PREFLIGHT_RATIO_MIN_BYTES
+                    and total_uncompressed > max_ratio * max(total_compressed, 1)):
+                ratio = total_uncompressed / max(total_compressed, 1)
+                return fail('zip_bomb', f"compression ratio {ratio:.0f}:1")
+
+            if verify_crc:
+                # ZipExtFile kiểm tra CRC khi đọc hết part
+                for part in DOCX_REQUIRED_PARTS:
+                    try:
+                        with archive.open(part) as member:
+                            while member.read(1024 * 1024):
+                                pass
+                    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                        return fail('crc_mismatch', f"{part}: {e}")
+    except zipfile.BadZipFile as e:
+        # Không có End of Central Directory: upload bị cắt cụt
+        return fail('truncated', str(e))
+    except (OSError, NotImplementedError, ValueError) as e:
+        return fail('not_zip', str(e))
+
+    result["ok"] = True
+    return result
+
+
+class ConversionTimingModel:
+    """
+    Mô hình thời gian conversion từ lịch sử (kích thước file + số trang)
+    Dùng để đặt timeout theo từng file và ước lượng ETA cho batch
+    """
+
+    # Ước lượng số byte/trang khi DOCX không có docProps/app.xml
+    BYTES_PER_PAGE = 30 * 1024
+
+    def __init__(self, history_path, max_samples=500, min_samples=10,
+                 percentile=0.95, safety_factor=2.0, min_timeout=20, max_timeout=900,
+                 min_spread=2.0):
+        """
+        Args:
+            min_spread: Lịch sử phải có units lớn nhất >= min_spread * nhỏ nhất thì mới
+                fit được rate; không thì model không dự đoán (timeout = default)
+        """
+        self.history_path = history_path
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.safety_factor = safety_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_spread = min_spread
+        self.samples = []
+        self._fit = None
+        self._lock = threading.Lock()
+        try:
+            with open(history_path, 'r', encoding='utf-8') as f:
+                self.samples = json.load(f).get('samples', [])[-max_samples:]
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def _units(cls, size_bytes, pages):
+        if pages:
+            return float(pages)
+        return max(1.0, size_bytes / cls.BYTES_PER_PAGE)
+
+    def describe(self, docx_path):
+        """(size_bytes, pages) của input"""
+        return os.path.getsize(docx_path), read_docx_page_count(docx_path)
+
+    def record(self, size_bytes, pages, seconds):
+        """Ghi nhận một conversion thành công"""
+        with self._lock:
+            self.samples.append({"size": size_bytes, "pages": pages, "seconds": round(seconds, 3)})
+            self.samples = self.samples[-self.max_samples:]
+            self._fit = None
+            samples = list(self.samples)
+        try:
+            write_json_atomic(self.history_path, {"samples": samples})
+        except OSError as e:
+            logger.debug(f"Cannot write timing history: {e}")
+
+    def _fitted(self):
+        """
+        Least squares seconds = base + rate * units, và percentile của tỉ lệ thực tế/dự đoán
+        Returns:
+            (base, rate, ratio_percentile, min_units, max_units) hoặc None nếu chưa đủ
+            dữ liệu hoặc lịch sử không đủ đa dạng về kích thước để fit rate
+        """
+        with self._lock:
+            if self._fit is not None or len(self.samples) < self.min_samples:
+                return self._fit
+            points = [(self._units(s["size"], s["pages"]), s["seconds"]) for s in self.samples]
+            n = len(points)
+            min_x = min(x for x, _ in points)
+            max_x = max(x for x, _ in points)
+            if max_x < min_x * self.min_spread:
+                # Toàn tài liệu cùng cỡ: rate ≈ 0, mọi input sẽ bị dự đoán bằng trung bình
+                return None
+            mean_x = sum(x for x, _ in points) / n
+            mean_y = sum(y for _, y in points) / n
+            var_x = sum((x - mean_x) ** 2 for x, _ in points)
+            rate = 0.0
+            if var_x > 0:
+                rate = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x)
+            base = max(0.0, mean_y - rate * mean_x)
+            ratios = sorted(y / max(base + rate * x, 1e-3) for x, y in points)
+            ratio_p = ratios[min(n - 1, int(self.percentile * n))]
+            self._fit = (base, rate, max(1.0, ratio_p), min_x, max_x)
+            return self._fit
+
+    def predict(self, size_bytes, pages):
+        """
+        Thời gian conversion dự kiến (giây)
+        None nếu chưa đủ lịch sử hoặc input nằm ngoài khoảng kích thước đã gặp (không ngoại suy)
+        """
+        fit = self._fitted()
+        if fit is None:
+            return None
+        base, rate, _, min_x, max_x = fit
+        units = self._units(size_bytes, pages)
+        if not min_x <= units <= max_x:
+            return None
+        return base + rate * units
+
+    def timeout_for(self, size_bytes, pages, default=DEFAULT_CONVERSION_TIMEOUT):
+        """
+        Timeout theo percentile cao của lịch sử; default khi model không dự đoán được input này
+        Không bao giờ thấp hơn TIMEOUT_SECONDS_PER_PAGE * số trang
+        """
+        floor = self._units(size_bytes, pages) * TIMEOUT_SECONDS_PER_PAGE
+        fit = self._fitted()
+        estimate = self.predict(size_bytes, pages)
+        if fit is None or estimate is None:
+            timeout = max(default, floor)
+        else:
+            timeout = max(self.min_timeout, floor, estimate * fit[2] * self.safety_factor)
+        return int(min(self.max_timeout, timeout))
+
+
+def estimate_docx_cost(docx_path, timing_model=None):
+    """
+    Chi phí ước lượng (giây) của một DOCX cho scheduling
+    Dùng timing model nếu đã đủ lịch sử, không thì theo số trang (docProps/app.xml) hoặc size
+    """
+    try:
+        size_bytes, pages = os.path.getsize(docx_path), read_docx_page_count(docx_path)
+    except OSError:
+        return 0.0
+    if timing_model is not None:
+        estimate = timing_model.predict(size_bytes, pages)
+        if estimate is not None:
+            return estimate
+    return ConversionTimingModel._units(size_bytes, pages) * SJF_SECONDS_PER_PAGE
+
+
+def sjf_priority(cost, enqueued_at, aging=1.0):
+    """
+    Priority shortest-job-first có aging (nhỏ hơn = chạy trước)
+    Effective cost = cost - aging * thời gian đã chờ. Mọi job chờ cùng tốc độ nên thứ tự
+    tương đương cost + aging * enqueued_at, không đổi theo thời gian (dùng được cho heap)
+    """
+    return cost + aging * enqueued_at
+
+
+class ConverterMetrics:
+    """
+    Stage timings và counters của converter
+    Hook (callable(kind, name, value)) được gọi cho mỗi event để export ra hệ thống ngoài
+    """
+
+    STAGES = (
+        'validation', 'process_cleanup', 'profile_creation', 'subprocess',
+        'uno_conversion', 'output_discovery', 'page_trim', 'move', 'bookmark_verification',
+    )
+    COUNTERS = (
+        'conversions_success', 'conversions_failed', 'conversions_timeout',
+        'bootstrap_ini_errors', 'cache_hits', 'admission_waits', 'coalesced',
+    )
+
+    def __init__(self):
+        self.counters = {name: 0 for name in self.COUNTERS}
+        self.stages = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def _emit(self, kind, name, value):
+        for hook in self.hooks:
+            try:
+                hook(kind, name, value)
+            except Exception as e:
+                logger.debug(f"Metrics hook error: {e}")
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "sum": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+        self._emit('stage', stage, seconds)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+        self._emit('counter', counter, amount)
+
+    @contextmanager
+    def stage(self, name):
+        """Đo thời gian một stage: with metrics.stage('move'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+            }
+
+
+class PrometheusTextfileExporter:
+    """
+    Metrics hook ghi file .prom cho node_exporter textfile collector
+    File được ghi lại (atomic) mỗi khi một counter thay đổi, tức là sau mỗi conversion
+    """
+
+    def __init__(self, path, metrics, prefix='docx_converter'):
+        self.path = path
+        self.metrics = metrics
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, name, value):
+        if kind == 'counter':
+            self.write()
+
+    def render(self):
+        snapshot = self.metrics.snapshot()
+        p = self.prefix
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+        lines.append(f"# HELP {p}_stage_seconds Time spent in each conversion stage")
+        lines.append(f"# TYPE {p}_stage_seconds summary")
+        for stage, entry in sorted(snapshot["stages"].items()):
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        lines.append(f"# TYPE {p}_stage_seconds_max gauge")
+        for stage, entry in sorted(snapshot["stages"].items()):
+            lines.append(f'{p}_stage_seconds_max{{stage="{stage}"}} {entry["max"]:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        content = self.render()
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, self.path)
+
+
+class BatchManifest:
+    """
+    Manifest JSONL cho batch_convert incremental/resumable
+    Mỗi dòng ghi kết quả một file ngay khi hoàn thành; dòng sau cùng của một input là hiện hành
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.records = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Dòng cuối có thể ghi dở nếu lần chạy trước bị crash
+                    continue
+                self.records[record["input"]] = record
+        logger.info(f"📒 Loaded manifest with {len(self.records)} entries: {self.path}")
+
+    def _input_hash(self, input_path, st):
+        """Hash input; dùng lại hash trong manifest nếu size + mtime không đổi"""
+        key = str(input_path)
+        if key not in self._hashes:
+            record = self.records.get(key)
+            if (record and record.get("input_size") == st.st_size
+                    and record.get("input_mtime_ns") == st.st_mtime_ns):
+                self._hashes[key] = record["input_hash"]
+            else:
+                self._hashes[key] = hash_file(input_path)
+        return self._hashes[key]
+
+    def lookup(self, input_path, output_path, retry_failed=False):
+        """
+        Kiểm tra file đã được xử lý trong lần chạy trước chưa
+        Returns:
+            True/False (kết quả cũ) nếu được skip, None nếu cần convert
+        """
+        record = self.records.get(str(input_path))
+        if not record or record.get("output") != str(output_path):
+            return None
+        try:
+            st = os.stat(input_path)
+        except OSError:
+            return None
+        if record.get("input_hash") != self._input_hash(input_path, st):
+            return None
+        if record.get("status") == "success":
+            try:
+                if os.path.getsize(output_path) == record.get("output_size"):
+                    return True
+            except OSError:
+                pass
+            return None
+        return None if retry_failed else False
+
+    def record(self, input_path, output_path, success):
+        """Append kết quả một file vào manifest"""
+        st = os.stat(input_path)
+        record = {
+            "input": str(input_path),
+            "input_hash": self._input_hash(input_path, st),
+            "input_size": st.st_size,
+            "input_mtime_ns": st.st_mtime_ns,
+            "output": str(output_path),
+            "output_size": os.path.getsize(output_path) if success and os.path.exists(output_path) else None,
+            "status": "success" if success else "failed",
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with self._lock:
+            self.records[record["input"]] = record
+        append_jsonl(self.path, record)
+
+
+async def terminate_async_process_group(process, grace=10):
+    """Bản asyncio của terminate_process_group cho asyncio.subprocess.Process"""
+    if platform.system().lower() == 'windows':
+        if process.returncode is None:
+            killer = await asyncio.create_subprocess_exec(
+                'taskkill', '/F', '/T', '/PID', str(process.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            await killer.wait()
+        await process.wait()
+        return
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    await process.wait()
+
+
+def _uno_property(name, value):
+    from com.sun.star.beans import PropertyValue
+    p = PropertyValue()
+    p.Name = name
+    p.Value = value
+    return p
+
+
+class _PooledOffice:
+    """Một soffice instance chạy lâu dài, lắng nghe trên UNO pipe"""
+
+    def __init__(self, libreoffice_cmd, user_installation, command_wrapper=None):
+        self.libreoffice_cmd = libreoffice_cmd
+        self.user_installation = user_installation
+        self.command_wrapper = command_wrapper
+        self.pipe_name = f"docx_convert_{uuid.uuid4().hex[:12]}"
+        self.process = None
+        self.desktop = None
+        self.conversions = 0
+        self.broken = False
+
+    def start(self, startup_timeout=60):
+        """Khởi động soffice và chờ UNO bridge sẵn sàng"""
+        import uno
+
+        cmd = [
+            self.libreoffice_cmd,
+            '--headless',
+            '--invisible',
+            '--nodefault',
+            '--nolockcheck',
+            '--nologo',
+            '--norestore',
+            f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext',
+            f'-env:UserInstallation={self.user_installation}',
+        ]
+        if self.command_wrapper is not None:
+            cmd = self.command_wrapper(cmd)
+        self.process = popen_process_group(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        deadline = time.time() + startup_timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"soffice exited during startup (code {self.process.returncode})")
+            try:
+                ctx = resolver.resolve(
+                    f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+                )
+                break
+            except Exception:
+                if time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"soffice did not accept connections within {startup_timeout}s")
+                time.sleep(0.25)
+
+        self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        self.conversions = 0
+        self.broken = False
+        logger.info(f"🟢 Pooled LibreOffice started (pid {self.process.pid}, pipe {self.pipe_name})")
+
+    def convert(self, input_path, output_pdf, filter_options, timeout):
+        """Convert qua UNO; kill process và raise subprocess.TimeoutExpired nếu quá timeout"""
+        import uno
+
+        prop = _uno_property
+        if self.desktop is None:
+            self.broken = True
+            logger.error("❌ Pooled LibreOffice is not running")
+            return False
+
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self.kill()
+
+        timer = threading.Timer(timeout, on_timeout)
+        timer.daemon = True
+        timer.start()
+        document = None
+        try:
+            document = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(input_path)),
+                "_blank", 0,
+                (prop("Hidden", True), prop("ReadOnly", True)),
+            )
+            filter_data = uno.Any(
+                "[]com.sun.star.beans.PropertyValue",
+                tuple(prop(name, value) for name, value in filter_options.items()),
+            )
+            uno.invoke(document, "storeToURL", (
+                uno.systemPathToFileUrl(os.path.abspath(output_pdf)),
+                (prop("FilterName", "writer_pdf_Export"), prop("FilterData", filter_data)),
+            ))
+            self.conversions += 1
+            return True
+        except Exception as e:
+            self.broken = True
+            if timed_out.is_set():
+                # Báo timeout như đường subprocess để caller đếm conversions_timeout
+                raise subprocess.TimeoutExpired(input_path, timeout) from e
+            logger.error(f"❌ Pooled conversion error: {e}")
+            return False
+        finally:
+            timer.cancel()
+            if document is not None and not self.broken:
+                try:
+                    document.close(True)
+                except Exception:
+                    self.broken = True
+
+    def warm_up(self, output_pdf, filter_options):
+        """Nạp Writer và PDF export filter bằng cách export một document rỗng"""
+        import uno
+
+        prop = _uno_property
+        document = self.desktop.loadComponentFromURL(
+            "private:factory/swriter", "_blank", 0, (prop("Hidden", True),)
+        )
+        try:
+            filter_data = uno.Any(
+                "[]com.sun.star.beans.PropertyValue",
+                tuple(prop(name, value) for name, value in filter_options.items()),
+            )
+            uno.invoke(document, "storeToURL", (
+                uno.systemPathToFileUrl(os.path.abspath(output_pdf)),
+                (prop("FilterName", "writer_pdf_Export"), prop("FilterData", filter_data)),
+            ))
+        finally:
+            document.close(True)
+
+    def kill(self):
+        if self.process:
+            terminate_process_group(self.process, grace=0)
+
+    def stop(self, grace=10):
+        """Tắt soffice instance"""
+        if self.desktop is not None and self.process and self.process.poll() is None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+        self.desktop = None
+        if self.process:
+            terminate_process_group(self.process, grace)
+
+
+class InotifyWatcher:
+    """
+    inotify qua ctypes (Linux), không cần package ngoài
+    Raise OSError khi platform không có inotify
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    _EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
     def __init__(self):
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify not available: {e}")
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._get_errno = ctypes.get_errno
+        self.fd = fd
+        self.watches = {}  # wd -> directory
+
+    def add_watch(self, directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY):
+        wd = self._add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(self._get_errno(), f"inotify_add_watch failed: {directory}")
+        self.watches[wd] = directory
+        return wd
+
+    def read_events(self, timeout):
+        """Chờ tối đa timeout giây; trả về list (directory, name, mask)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self._EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            events.append((self.watches.get(wd), name, mask))
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class LibreOfficeWorkerPool:
+    """
+    Pool N soffice instance chạy lâu dài, conversion được gửi qua UNO pipe
+    Tránh chi phí khởi động LibreOffice cho mỗi file
+    """
+
+    def __init__(self, libreoffice_cmd, size, profile_factory,
+                 startup_timeout=60, max_conversions_per_worker=200, command_wrapper=None):
+        self.libreoffice_cmd = libreoffice_cmd
+        self.command_wrapper = command_wrapper
+        self.size = size
+        self.profile_factory = profile_factory
+        self.startup_timeout = startup_timeout
+        self.max_conversions_per_worker = max_conversions_per_worker
+        self.workers = []
+        self._idle = queue.Queue()
+
+    def start(self):
+        """Khởi động tất cả worker; raise nếu không có UNO bindings"""
+        import uno  # noqa: F401  (python3-uno)
+
+        try:
+            for _ in range(self.size):
+                worker = _PooledOffice(
+                    self.libreoffice_cmd, self.profile_factory(), self.command_wrapper
+                )
+                worker.start(self.startup_timeout)
+                self.workers.append(worker)
+                self._idle.put(worker)
+        except Exception:
+            self.shutdown()
+            raise
+        logger.info(f"♻️  LibreOffice worker pool ready ({self.size} instances)")
+
+    def _recycle(self, worker):
+        """Restart worker bị lỗi hoặc đã xử lý quá nhiều file"""
+        worker.stop()
+        worker.user_installation = self.profile_factory()
+        worker.start(self.startup_timeout)
+
+    def convert(self, input_path, output_pdf, filter_options, timeout):
+        worker = self._idle.get()
+        try:
+            return worker.convert(input_path, output_pdf, filter_options, timeout)
+        finally:
+            try:
+                if worker.broken or worker.conversions >= self.max_conversions_per_worker:
+                    self._recycle(worker)
+            except Exception as e:
+                logger.error(f"Cannot restart pooled LibreOffice: {e}")
+            self._idle.put(worker)
+
+    def warm_up(self, output_dir, filter_options):
+        """Nạp Writer + PDF filter trên mọi worker (conversion đầu tiên không phải chờ)"""
+        for worker in self.workers:
+            worker.warm_up(
+                os.path.join(output_dir, f"warm_up_{worker.pipe_name}.pdf"), filter_options
+            )
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+        self._idle = queue.Queue()
+
+
+class DocxToPdfConverter:
+    # Possible LibreOffice paths on Windows (updated for newer versions)
+    WINDOWS_LIBREOFFICE_PATHS = [
+        r"C:\Program Files\LibreOffice\program\soffice.exe",
+        r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+        # Support for LibreOffice 24, 25 versions
+        r"C:\Program Files\LibreOffice 25.2\program\soffice.exe",
+        r"C:\Program Files (x86)\LibreOffice 25.2\program\soffice.exe",
+        r"C:\Program Files\LibreOffice 24.8\program\soffice.exe",
+        r"C:\Program Files (x86)\LibreOffice 24.8\program\soffice.exe",
+        r"C:\Program Files\LibreOffice 7.0\program\soffice.exe",
+        r"C:\Program Files (x86)\LibreOffice 7.0\program\soffice.exe",
+    ]
+    WINDOWS_LIBREOFFICE_COMMANDS = ['soffice', 'libreoffice']
+    UNIX_LIBREOFFICE_COMMANDS = ['libreoffice', 'soffice']
+    
+    def __init__(self, pool_size=0, use_profile_template=True, use_probe_cache=True,
+                 pdf_cache_dir=None, pdf_cache_max_bytes=2 * 1024 ** 3,
+                 adaptive_timeout=True, prometheus_textfile=None, staging_dir=None,
+                 warm_start=False, priority_class=None, cgroup_root=None,
+                 memory_admission=False, memory_limit=None, coalesce_inflight=True,
+                 background_cleanup=True):
+        """
+        Args:
+            staging_dir: None = scratch/profiles trên temp dir mặc định,
+                'auto' = tmpfs (/dev/shm) nếu có, hoặc path tới tmpfs khác;
+                fallback về disk khi tmpfs không đủ chỗ
+            warm_start: Khởi động sẵn một soffice ở background (khi pool_size = 0) để
+                conversion đầu tiên không phải chịu cold start
+            priority_class: 'interactive' | 'normal' | 'bulk' (None = không đổi priority);
+                nice/ionice cho soffice, override theo từng call (trừ worker pool:
+                soffice của pool luôn chạy với class này)
+            cgroup_root: cgroup v2 đã delegate, thêm cpu.weight/io.weight theo class
+            memory_admission: True = chờ đủ MemAvailable trước khi start soffice
+                (controller dùng chung trong process), hoặc một MemoryAdmissionController
+            memory_limit: Giới hạn bộ nhớ (bytes) mỗi soffice: cgroup v2 memory.max nếu có
+                cgroup_root, không thì RLIMIT_AS qua prlimit
+            coalesce_inflight: Conversion trùng nội dung với một conversion đang chạy
+                (thread khác) chờ kết quả đó rồi link/copy PDF thay vì chạy soffice lần nữa
+            background_cleanup: Xoá scratch dirs/profiles ở janitor thread (dùng chung trong
+                process, cũng dọn profile mồ côi của process đã crash); False = xoá ngay
+        """
+        if priority_class is not None and priority_class not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority_class}")
         self.temp_dir = None
+        self.disk_temp_dir = None
+        self.staging_root = find_staging_dir(staging_dir) if staging_dir else None
         self.libreoffice_cmd = None
+        self.libreoffice_version = None
         self.supports_pdf_parameters = False
+        self.use_probe_cache = use_probe_cache
+        self.metrics = ConverterMetrics()
+        if prometheus_textfile:
+            self.metrics.add_hook(PrometheusTextfileExporter(prometheus_textfile, self.metrics))
+        self.timing_model = None
+        if adaptive_timeout:
+            self.timing_model = ConversionTimingModel(
+                os.path.join(default_cache_dir(), 'timing_history.json')
+            )
+        self.pdf_cache = None
+        if pdf_cache_dir:
+            self.pdf_cache = PdfConversionCache(pdf_cache_dir, pdf_cache_max_bytes)
         self.system = platform.system().lower()
+        self.priority_class = priority_class
+        self.cgroup_root = cgroup_root
+        self.priority_cgroups = setup_priority_cgroups(cgroup_root) if cgroup_root else {}
+        if memory_admission is True:
+            memory_admission = shared_memory_admission()
+        self.memory_admission = memory_admission or None
+        self.memory_limit = memory_limit
+        self.coalesce_inflight = coalesce_inflight
+        self._inflight = {}  # hash input -> {"done", "output", "success"} của conversion đang chạy
+        self._inflight_lock = threading.Lock()
         self.active_profiles = []  # Track created profiles for cleanup
+        self.janitor = shared_janitor() if background_cleanup else None
+        self.pool = None
+        self.use_profile_template = use_profile_template
+        self._profile_template = None  # None = chưa init, False = init thất bại
+        self._profile_template_lock = threading.Lock()
+        self._processes = set()  # soffice processes do converter này spawn
+        self._async_processes = set()  # soffice processes của async API
+        self._process_lock = threading.Lock()
+        self._warm_start_thread = None
+        self._warm_profile = None  # Profile đã init sẵn cho conversion đầu tiên (không có UNO)
+        self._warm_pool = None  # Instance UNO đã warm-up cho conversion đầu tiên
         self.setup_temp_directory()
         self.check_dependencies()
+        if pool_size > 0:
+            self.start_worker_pool(pool_size)
+        elif warm_start:
+            self.start_warm_up()
+    
+    def start_worker_pool(self, size):
+        """
+        Khởi động pool soffice chạy lâu dài; convert_single_file sẽ dùng pool
+        Fallback về mode một process/file nếu không có python3-uno
+        """
+        pool = self._new_worker_pool(size)
+        if pool is None:
+            return False
+        self.pool = pool
+        return True
+    
+    def _new_worker_pool(self, size, warn_no_uno=True):
+        """Start LibreOfficeWorkerPool, None nếu không có python3-uno hoặc start lỗi"""
+        pool = LibreOfficeWorkerPool(
+            self.libreoffice_cmd,
+            size,
+            profile_factory=lambda: self.create_safe_profile_path()[0],
+            command_wrapper=self._wrap_pooled_command,
+        )
+        try:
+            pool.start()
+        except ImportError:
+            if warn_no_uno:
+                logger.warning("⚠️  python3-uno not available, worker pool disabled")
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️  Cannot start LibreOffice worker pool: {e}")
+            return None
+        return pool
+
+    def start_warm_up(self):
+        """Khởi động LibreOffice ở background trong lúc caller chuẩn bị input"""
+        self._warm_start_thread = threading.Thread(
+            target=self._warm_up, name="soffice-warm-up", daemon=True
+        )
+        self._warm_start_thread.start()
+    
+    def _warm_up(self):
+        """
+        Có python3-uno: một instance (không phải self.pool), nạp sẵn Writer + PDF export filter,
+        chỉ phục vụ conversion đầu tiên rồi được tắt
+        Không có: init profile (clone template) và chạy soffice --terminate_after_init
+        để binary/libraries nằm trong page cache; conversion đầu tiên dùng lại profile này
+        """
+        start_time = time.time()
+        try:
+            warm_pool = self._new_worker_pool(1, warn_no_uno=False)
+            if warm_pool is not None:
+                warm_pool.warm_up(self.temp_dir, PDF_EXPORT_OPTIONS)
+                self._warm_pool = warm_pool
+            else:
+                profile_uri = self.create_worker_profile()
+                process = self._spawn_soffice(
+                    self._soffice_init_command(profile_uri),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                try:
+                    process.wait(timeout=120)
+                finally:
+                    self._terminate_soffice(process)
+                self._warm_profile = profile_uri
+            logger.info(f"🔥 LibreOffice warmed up in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.warning(f"⚠️  LibreOffice warm-up failed: {e}")
+    
+    def _await_warm_start(self, timeout=120):
+        """Chờ warm-up xong: dùng instance đang khởi động nhanh hơn cold start mới"""
+        thread = self._warm_start_thread
+        if thread is None or thread is threading.current_thread():
+            return
+        if thread.is_alive():
+            logger.info("⏳ Waiting for LibreOffice warm-up...")
+            thread.join(timeout)
+        self._warm_start_thread = None
+    
+    def _take_warm_profile(self):
+        with self._process_lock:
+            profile_uri, self._warm_profile = self._warm_profile, None
+        return profile_uri
+    
+    def _take_warm_pool(self):
+        """
+        Instance warm-up cho đúng một conversion; None nếu đã bị lấy
+        Không dùng khi phải cắt trang sau convert (LibreOffice cũ + page range):
+        output UNO đã đúng page range, cắt lần nữa sẽ sai
+        """
+        if not self.supports_pdf_parameters and self.current_page_range() is not None:
+            return None
+        with self._process_lock:
+            pool, self._warm_pool = self._warm_pool, None
+        return pool
+    
+    @staticmethod
+    def _release_warm_pool(pool):
+        """Tắt instance warm-up ở background, không tính vào latency của conversion"""
+        if pool is not None:
+            threading.Thread(target=pool.shutdown, name="soffice-warm-down", daemon=True).start()
     
     def setup_temp_directory(self):
-        """Tạo thư mục temp để xử lý"""
-        self.temp_dir = tempfile.mkdtemp(prefix='docx_convert_')
+        """Tạo thư mục temp để xử lý (trên tmpfs nếu bật staging)"""
+        self.temp_dir = tempfile.mkdtemp(prefix='docx_convert_', dir=self.staging_root)
+        self.disk_temp_dir = self.temp_dir
+        if self.staging_root:
+            # Disk fallback khi tmpfs gần đầy
+            self.disk_temp_dir = tempfile.mkdtemp(prefix='docx_convert_')
+            logger.info(f"⚡ RAM-backed staging: {self.staging_root}")
         logger.info(f"Temp directory created: {self.temp_dir}")
     
     def find_libreoffice_executable(self):
         """Tìm executable LibreOffice trên các platform"""
         if self.system == 'windows':
-            # Possible LibreOffice paths on Windows (updated for newer versions)
-            possible_paths = [
-                r"C:\Program Files\LibreOffice\program\soffice.exe",
-                r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
-                # Support for LibreOffice 24, 25 versions
-                r"C:\Program Files\LibreOffice 25.2\program\soffice.exe",
-                r"C:\Program Files (x86)\LibreOffice 25.2\program\soffice.exe",
-                r"C:\Program Files\LibreOffice 24.8\program\soffice.exe",
-                r"C:\Program Files (x86)\LibreOffice 24.8\program\soffice.exe",
-                r"C:\Program Files\LibreOffice 7.0\program\soffice.exe",
-                r"C:\Program Files (x86)\LibreOffice 7.0\program\soffice.exe",
-            ]
-            
             # Check PATH first
-            for cmd in ['soffice', 'libreoffice']:
+            for cmd in self.WINDOWS_LIBREOFFICE_COMMANDS:
                 try:
                     result = subprocess.run([cmd, '--version'], capture_output=True, timeout=10)
                     if result.returncode == 0:
@@ -63,7 +2027,7 @@ class DocxToPdfConverter:
                     pass
             
             # Check common installation paths
-            for path in possible_paths:
+            for path in self.WINDOWS_LIBREOFFICE_PATHS:
                 if os.path.exists(path):
                     return path
             
@@ -71,9 +2035,7 @@ class DocxToPdfConverter:
             
         else:  # Linux/Mac
             # Check common commands
-            commands = ['libreoffice', 'soffice']
-            
-            for cmd in commands:
+            for cmd in self.UNIX_LIBREOFFICE_COMMANDS:
                 try:
                     result = subprocess.run([cmd, '--version'], capture_output=True, timeout=10)
                     if result.returncode == 0:
@@ -83,27 +2045,138 @@ class DocxToPdfConverter:
             
             return None
     
+    def _profile_base_dir(self):
+        """Thư mục chứa LibreOffice profiles"""
+        if self.staging_root and free_bytes(self.staging_root) >= STAGING_MIN_FREE_BYTES:
+            return os.path.join(self.staging_root, 'LibreOfficeProfiles')
+        if self.system == 'windows':
+            return os.path.join(os.environ.get('TEMP', self.temp_dir), 'LibreOfficeProfiles')
+        # Linux/Mac: Use /tmp
+        return "/tmp/LibreOfficeProfiles"
+    
+    def _profile_uri(self, profile_dir):
+        """Convert profile path sang file URI cho -env:UserInstallation"""
+        if self.system == 'windows':
+            # Convert to proper Windows file URI
+            return f"file:///{profile_dir.replace(os.sep, '/')}"
+        return f"file://{profile_dir}"
+    
+    def ensure_profile_template(self):
+        """
+        Init template profile một lần (first-run của LibreOffice + PDF settings)
+        Các profile sau được clone từ template thay vì init lại từ đầu
+        
+        Returns:
+            Đường dẫn template, hoặc None nếu không tạo được
+        """
+        if not self.use_profile_template:
+            return None
+        
+        with self._profile_template_lock:
+            if self._profile_template is not None:
+                return self._profile_template or None
+            
+            # Template riêng cho từng LibreOffice binary/version
+            executable = shutil.which(self.libreoffice_cmd) or self.libreoffice_cmd
+            try:
+                fingerprint = f"{os.path.realpath(executable)}:{os.stat(executable).st_mtime_ns}"
+            except OSError:
+                fingerprint = executable
+            key = hashlib.sha1((fingerprint + PDF_EXPORT_REGISTRY_XCU).encode('utf-8')).hexdigest()[:12]
+            
+            profile_base = self._profile_base_dir()
+            template_dir = os.path.join(profile_base, f"template_{key}")
+            
+            if os.path.exists(os.path.join(template_dir, PROFILE_TEMPLATE_MARKER)):
+                self._profile_template = template_dir
+                return template_dir
+            
+            building_dir = os.path.join(profile_base, f"template_building_{uuid.uuid4().hex[:8]}")
+            try:
+                self._build_profile_template(building_dir)
+                try:
+                    os.rename(building_dir, template_dir)
+                except OSError:
+                    # Process khác đã tạo template trước
+                    shutil.rmtree(building_dir, ignore_errors=True)
+                    if not os.path.exists(os.path.join(template_dir, PROFILE_TEMPLATE_MARKER)):
+                        raise
+                self._profile_template = template_dir
+                logger.info(f"📁 LibreOffice profile template ready: {template_dir}")
+                return template_dir
+            except Exception as e:
+                shutil.rmtree(building_dir, ignore_errors=True)
+                logger.warning(f"⚠️  Cannot build profile template, using fresh profiles: {e}")
+                self._profile_template = False
+                return None
+    
+    def _soffice_init_command(self, user_installation):
+        """soffice chỉ chạy first-run init trên profile rồi thoát"""
+        return [
+            self.libreoffice_cmd,
+            '--headless',
+            '--invisible',
+            '--nodefault',
+            '--nolockcheck',
+            '--nologo',
+            '--norestore',
+            '--terminate_after_init',
+            f'-env:UserInstallation={user_installation}',
+        ]
+    
+    def _build_profile_template(self, template_dir, timeout=120):
+        """Chạy LibreOffice first-run init trên profile có sẵn PDF settings"""
+        registry_file = os.path.join(template_dir, "user", "registrymodifications.xcu")
+        os.makedirs(os.path.dirname(registry_file), exist_ok=True)
+        with open(registry_file, 'w', encoding='utf-8') as f:
+            f.write(PDF_EXPORT_REGISTRY_XCU)
+        
+        cmd = self._soffice_init_command(self._profile_uri(template_dir))
+        logger.info("Initializing LibreOffice profile template (first run)...")
+        process = self._spawn_soffice(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            process.wait(timeout=timeout)
+        finally:
+            self._terminate_soffice(process)
+        
+        if process.returncode != 0:
+            raise RuntimeError(f"LibreOffice first-run init failed (code {process.returncode})")
+        
+        # LibreOffice ghi lại registrymodifications.xcu khi thoát; đảm bảo PDF settings còn
+        with open(registry_file, 'r', encoding='utf-8', errors='ignore') as f:
+            if 'ExportBookmarks' not in f.read():
+                with open(registry_file, 'w', encoding='utf-8') as fw:
+                    fw.write(PDF_EXPORT_REGISTRY_XCU)
+        
+        # Lock file của lần chạy init không được clone sang worker
+        lock_file = os.path.join(template_dir, "user", ".lock")
+        if os.path.exists(lock_file):
+            os.remove(lock_file)
+        
+        open(os.path.join(template_dir, PROFILE_TEMPLATE_MARKER), 'w').close()
+    
     def create_safe_profile_path(self):
         """
         Tạo safe profile path cho Windows và Linux
         Fix lỗi bootstrap.ini corrupt
+        Profile được clone từ template đã init sẵn (nếu có)
         """
         # Generate unique profile name
         profile_id = f"lo_profile_{uuid.uuid4().hex[:8]}"
+        profile_base = self._profile_base_dir()
+        profile_dir = os.path.join(profile_base, profile_id)
+        profile_uri = self._profile_uri(profile_dir)
         
-        if self.system == 'windows':
-            # Windows: Use proper Windows path format
-            profile_base = os.path.join(os.environ.get('TEMP', self.temp_dir), 'LibreOfficeProfiles')
-            profile_dir = os.path.join(profile_base, profile_id)
-            # Convert to proper Windows file URI
-            profile_uri = f"file:///{profile_dir.replace(os.sep, '/')}"
+        template_dir = self.ensure_profile_template()
+        if template_dir:
+            clone_directory(template_dir, profile_dir)
         else:
-            # Linux/Mac: Use /tmp
-            profile_dir = f"/tmp/LibreOfficeProfiles/{profile_id}"
-            profile_uri = f"file://{profile_dir}"
-        
-        # Create directory
-        os.makedirs(profile_dir, exist_ok=True)
+            # Create directory
+            os.makedirs(profile_dir, exist_ok=True)
+        write_profile_owner(profile_dir)
+        register_live_profile(profile_dir)
+        if self.janitor is not None:
+            self.janitor.watch_profile_base(profile_base)
         
         # Track for cleanup
         self.active_profiles.append(profile_dir)
@@ -118,36 +2191,12 @@ class DocxToPdfConverter:
         """
         profile_uri, profile_dir = self.create_safe_profile_path()
         
-        # Tạo thư mục config
-        config_dir = os.path.join(profile_dir, "user", "config")
-        os.makedirs(config_dir, exist_ok=True)
-        
-        # Tạo file registrymodifications.xcu với PDF export settings
-        registry_content = '''<?xml version="1.0" encoding="UTF-8"?>
-<oor:items xmlns:oor="http://openoffice.org/2001/registry" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-  <item oor:path="/org.openoffice.Office.Common/Filter/PDF/Export">
-    <prop oor:name="ExportBookmarks" oor:op="fuse">
-      <value>true</value>
-    </prop>
-    <prop oor:name="ExportBookmarksToNamedDestinations" oor:op="fuse">
-      <value>true</value>
-    </prop>
-    <prop oor:name="UseTaggedPDF" oor:op="fuse">
-      <value>true</value>
-    </prop>
-    <prop oor:name="ConvertOOoTargetToPDFTarget" oor:op="fuse">
-      <value>true</value>
-    </prop>
-    <prop oor:name="ExportLinksRelativeFsys" oor:op="fuse">
-      <value>false</value>
-    </prop>
-  </item>
-</oor:items>
-'''
-        
-        registry_file = os.path.join(config_dir, "registrymodifications.xcu")
-        with open(registry_file, 'w', encoding='utf-8') as f:
-            f.write(registry_content)
+        # Profile clone từ template đã có PDF settings
+        registry_file = os.path.join(profile_dir, "user", "registrymodifications.xcu")
+        if not os.path.exists(registry_file):
+            os.makedirs(os.path.dirname(registry_file), exist_ok=True)
+            with open(registry_file, 'w', encoding='utf-8') as f:
+                f.write(PDF_EXPORT_REGISTRY_XCU)
         
         logger.info(f"📁 Created LibreOffice profile with PDF settings: {profile_dir}")
         return profile_uri
@@ -166,6 +2215,7 @@ class DocxToPdfConverter:
             
             if result.returncode == 0:
                 version_line = result.stdout.strip()
+                self.libreoffice_version = version_line
                 logger.info(f"LibreOffice version detected: {version_line}")
                 
                 # More robust version parsing
@@ -205,8 +2255,75 @@ class DocxToPdfConverter:
             logger.warning(f"Cannot check LibreOffice version: {e}")
             return False
     
+    def _probe_cache_path(self):
+        return os.path.join(default_cache_dir(), 'libreoffice_probe.json')
+    
+    def _resolve_executable(self, cmd):
+        """Trả về (realpath, mtime_ns) của executable, chỉ dùng PATH lookup + stat"""
+        path = cmd if os.path.isabs(cmd) else shutil.which(cmd)
+        if not path:
+            return None, None
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, None
+        return os.path.realpath(path), mtime_ns
+    
+    def _read_probe_cache(self):
+        try:
+            with open(self._probe_cache_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def load_cached_probe(self):
+        """
+        Tìm kết quả probe đã cache cho executable LibreOffice
+        Cache key: đường dẫn binary + mtime, nên upgrade LibreOffice sẽ tự invalidate
+        """
+        if self.system == 'windows':
+            candidates = self.WINDOWS_LIBREOFFICE_COMMANDS + self.WINDOWS_LIBREOFFICE_PATHS
+        else:
+            candidates = self.UNIX_LIBREOFFICE_COMMANDS
+        
+        probes = self._read_probe_cache().get('probes', {})
+        for cmd in candidates:
+            real_path, mtime_ns = self._resolve_executable(cmd)
+            if real_path is None:
+                continue
+            entry = probes.get(real_path)
+            if entry and entry.get('mtime_ns') == mtime_ns and entry.get('cmd') == cmd:
+                return entry
+        return None
+    
+    def save_probe(self):
+        """Lưu kết quả probe hiện tại vào on-disk cache"""
+        real_path, mtime_ns = self._resolve_executable(self.libreoffice_cmd)
+        if real_path is None:
+            return
+        cache = self._read_probe_cache()
+        cache.setdefault('probes', {})[real_path] = {
+            'cmd': self.libreoffice_cmd,
+            'mtime_ns': mtime_ns,
+            'version': self.libreoffice_version,
+            'supports_pdf_parameters': self.supports_pdf_parameters,
+        }
+        try:
+            write_json_atomic(self._probe_cache_path(), cache)
+        except OSError as e:
+            logger.debug(f"Cannot write probe cache: {e}")
+    
     def check_dependencies(self):
         """Kiểm tra LibreOffice có được cài đặt không"""
+        if self.use_probe_cache:
+            probe = self.load_cached_probe()
+            if probe:
+                self.libreoffice_cmd = probe['cmd']
+                self.libreoffice_version = probe['version']
+                self.supports_pdf_parameters = probe['supports_pdf_parameters']
+                logger.info(f"✅ LibreOffice executable found (cached probe): {self.libreoffice_cmd}")
+                return True
+        
         self.libreoffice_cmd = self.find_libreoffice_executable()
         
         if not self.libreoffice_cmd:
@@ -220,24 +2337,18 @@ class DocxToPdfConverter:
             
             sys.exit(1)
         
-        # Check version compatibility
-        self.supports_pdf_parameters = self.check_libreoffice_version()
+        # Check version compatibility (cũng xác nhận LibreOffice có phản hồi)
+        self.supports_pdf_parameters = bool(self.check_libreoffice_version())
         
-        try:
-            result = subprocess.run(
-                [self.libreoffice_cmd, '--version'], 
-                capture_output=True, 
-                text=True,
-                timeout=15
-            )
-            if result.returncode == 0:
-                logger.info(f"✅ LibreOffice executable found: {self.libreoffice_cmd}")
-                return True
-            else:
-                raise FileNotFoundError("LibreOffice not responding")
-        except (FileNotFoundError, subprocess.TimeoutExpired):
+        if self.libreoffice_version is None:
             logger.error("❌ LibreOffice không hoạt động!")
             sys.exit(1)
+        
+        logger.info(f"✅ LibreOffice executable found: {self.libreoffice_cmd}")
+        
+        if self.use_probe_cache:
+            self.save_probe()
+        return True
     
     def validate_input_file(self, input_path):
         """Kiểm tra file input hợp lệ"""
@@ -247,14 +2358,11 @@ class DocxToPdfConverter:
         if not input_path.lower().endswith('.docx'):
             raise ValueError(f"File phải có định dạng .docx: {input_path}")
         
-        # Kiểm tra file có thể đọc được
-        try:
-            with open(input_path, 'rb') as f:
-                header = f.read(4)
-                if header != b'PK\x03\x04':  # ZIP header (DOCX is ZIP)
-                    raise ValueError(f"File DOCX không hợp lệ: {input_path}")
-        except Exception as e:
-            raise ValueError(f"Không thể đọc file: {e}")
+        # Pre-flight: file hỏng/mã hoá/zip bomb bị loại trước khi launch soffice
+        preflight = preflight_docx(input_path)
+        if not preflight["ok"]:
+            logger.error(f"❌ Pre-flight failed ({preflight['reason']}): {preflight['detail']}")
+            raise DocxPreflightError(preflight)
         
         logger.info(f"✅ Input file validated: {input_path}")
     
@@ -272,168 +2380,615 @@ class DocxToPdfConverter:
         logger.info(f"Output path prepared: {output_path}")
         return str(output_path)
     
-    def kill_existing_libreoffice_processes(self):
-        """Kill any existing LibreOffice processes to avoid conflicts"""
-        try:
-            if self.system == 'windows':
-                subprocess.run(['taskkill', '/F', '/IM', 'soffice.exe'], 
-                             capture_output=True, timeout=10)
-                subprocess.run(['taskkill', '/F', '/IM', 'soffice.bin'], 
-                             capture_output=True, timeout=10)
-            else:
-                subprocess.run(['pkill', '-f', 'soffice'], 
-                             capture_output=True, timeout=10)
-            
-            # Wait a moment for processes to clean up
-            time.sleep(2)
-            
-        except Exception as e:
-            logger.debug(f"Process cleanup: {e}")
+    @contextmanager
+    def priority(self, priority_class):
+        """Chạy các conversion trong block với priority class này (None = giữ nguyên)"""
+        if priority_class is not None and priority_class not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority_class}")
+        token = _priority_context.set(priority_class) if priority_class else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                _priority_context.reset(token)
+    
+    def current_priority_class(self):
+        return _priority_context.get() or self.priority_class
+    
+    @contextmanager
+    def page_range(self, page_range):
+        """Chỉ export page_range (vd '1-3' hoặc 3 = 3 trang đầu) cho các conversion trong block"""
+        token = None
+        if page_range is not None:
+            token = _page_range_context.set(normalize_page_range(page_range))
+        try:
+            yield
+        finally:
+            if token is not None:
+                _page_range_context.reset(token)
+    
+    def current_page_range(self):
+        return _page_range_context.get()
+    
+    def _native_page_range(self):
+        """PageRange truyền thẳng được cho soffice (JSON filter hoặc UNO FilterData)"""
+        return self.pool is not None or self.supports_pdf_parameters
+    
+    def pdf_export_options(self):
+        """PDF export options cho conversion hiện tại (thêm PageRange nếu có)"""
+        page_range = self.current_page_range()
+        if page_range is None:
+            return PDF_EXPORT_OPTIONS
+        return dict(PDF_EXPORT_OPTIONS, PageRange=page_range)
+    
+    def _wrap_soffice_command(self, cmd, cgroup_dir=None):
+        """Áp priority class của conversion hiện tại và memory limit (rlimit) cho command soffice"""
+        return self._wrap_command_with_class(cmd, self.current_priority_class(), cgroup_dir)
+    
+    def _wrap_command_with_class(self, cmd, priority_class, cgroup_dir=None):
+        if self.memory_limit and cgroup_dir is None:
+            cmd = rlimit_command(cmd, self.memory_limit)
+        return priority_command(
+            cmd, priority_class, cgroup_dir or self.priority_cgroups.get(priority_class)
+        )
+    
+    def _wrap_pooled_command(self, cmd):
+        """
+        Command cho soffice của worker pool: luôn dùng priority class của constructor
+        Instance sống qua nhiều conversion (và được restart trong conversion của caller bất kỳ)
+        nên không lấy class theo context; priority_class theo từng call không áp cho pool
+        """
+        return self._wrap_command_with_class(cmd, self.priority_class)
+    
+    def _admit_conversion(self):
+        """
+        Memory admission + cgroup memory.max cho một soffice conversion
+        Returns: (ticket, cgroup_dir) - truyền lại cho _release_conversion
+        """
+        ticket = None
+        if self.memory_admission is not None:
+            ticket, waited = self.memory_admission.acquire()
+            if waited >= self.memory_admission.poll_interval:
+                self.metrics.increment('admission_waits')
+                self.metrics.observe('admission_wait', waited)
+        cgroup_dir = None
+        if self.memory_limit and self.cgroup_root and self.system != 'windows':
+            parent = self.priority_cgroups.get(self.current_priority_class()) or self.cgroup_root
+            cgroup_dir = create_memory_cgroup(parent, self.memory_limit)
+        return ticket, cgroup_dir
+    
+    def _start_memory_sampler(self, pid, ticket):
+        """Đo RSS của process group soffice trong lúc chạy (footprint cho admission)"""
+        if ticket is None or self.system == 'windows':
+            return None
+        stop_event = threading.Event()
+        threading.Thread(
+            target=sample_process_group_rss,
+            args=(pid, lambda rss: self.memory_admission.update(ticket, rss), stop_event),
+            daemon=True,
+        ).start()
+        return stop_event
+    
+    def _release_conversion(self, ticket, cgroup_dir, sampler=None):
+        if sampler is not None:
+            sampler.set()
+        if ticket is not None:
+            self.memory_admission.release(ticket)
+        if cgroup_dir:
+            remove_cgroup(cgroup_dir)
+    
+    def _priority_creationflags(self):
+        """Windows: CREATE_NEW_PROCESS_GROUP + priority class của process"""
+        flags = subprocess.CREATE_NEW_PROCESS_GROUP
+        priority_class = self.current_priority_class()
+        if priority_class:
+            flags |= PRIORITY_CLASSES[priority_class]["windows_flag"]
+        return flags
+    
+    def _record_priority_stats(self, enqueued_at, started_at):
+        """Thời gian chờ (queue) và latency tổng theo priority class"""
+        priority_class = self.current_priority_class() or 'default'
+        self.metrics.observe(f"queue_wait_{priority_class}", max(0.0, started_at - enqueued_at))
+        self.metrics.observe(f"latency_{priority_class}", time.monotonic() - enqueued_at)
+    
+    def priority_stats(self):
+        """Thống kê queue wait / latency (count, mean, max) theo priority class"""
+        stages = self.metrics.snapshot()["stages"]
+        stats = {}
+        for name, entry in stages.items():
+            for kind in ('queue_wait', 'latency'):
+                if name.startswith(kind + '_'):
+                    priority_class = name[len(kind) + 1:]
+                    stats.setdefault(priority_class, {})[kind] = {
+                        "count": entry["count"],
+                        "mean": entry["sum"] / entry["count"] if entry["count"] else 0.0,
+                        "max": entry["max"],
+                    }
+        return stats
+    
+    def _spawn_soffice(self, cmd, cgroup_dir=None, **kwargs):
+        """Start soffice trong process group riêng (với priority class hiện tại) và track để cleanup"""
+        if self.system == 'windows':
+            kwargs.setdefault('creationflags', self._priority_creationflags())
+        else:
+            cmd = self._wrap_soffice_command(cmd, cgroup_dir)
+        process = popen_process_group(cmd, **kwargs)
+        with self._process_lock:
+            self._processes.add(process)
+        return process
+    
+    def _terminate_soffice(self, process, grace=10):
+        """Terminate một soffice process (và process con) do converter này spawn"""
+        terminate_process_group(process, grace)
+        with self._process_lock:
+            self._processes.discard(process)
+    
+    def terminate_owned_processes(self, grace=10):
+        """
+        Terminate các LibreOffice process do converter này start
+        Không ảnh hưởng tới conversion của converter/service khác trên cùng máy
+        """
+        with self._process_lock:
+            processes = list(self._processes)
+            async_processes = list(self._async_processes)
+        for process in processes:
+            try:
+                self._terminate_soffice(process, grace)
+            except Exception as e:
+                logger.debug(f"Process cleanup: {e}")
+        # Async process được event loop reap; ở đây chỉ kill process group
+        for process in async_processes:
+            try:
+                if self.system == 'windows':
+                    subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                                   capture_output=True, timeout=10)
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+            except Exception as e:
+                logger.debug(f"Process cleanup: {e}")
+    
+    def create_worker_profile(self):
+        """
+        Tạo profile cho một worker (dùng lại qua nhiều conversion tuần tự)
+        Profile có sẵn PDF settings khi LibreOffice không support JSON parameters
+        """
+        with self.metrics.stage('profile_creation'):
+            if self.supports_pdf_parameters:
+                profile_uri, _ = self.create_safe_profile_path()
+                return profile_uri
+            return self.create_libreoffice_profile_with_pdf_settings()
+    
+    def _build_soffice_command(self, input_paths, convert_temp, user_installation=None):
+        """Tạo command soffice --convert-to cho một hoặc nhiều file input"""
+        # Prepare LibreOffice command
+        if self.supports_pdf_parameters:
+            # Modern LibreOffice: Use JSON parameters
+            pdf_filter = build_pdf_filter_string(self.pdf_export_options())
+            logger.info("🔖 Using advanced PDF export with bookmark preservation")
+        else:
+            # Older LibreOffice: Use custom profile
+            pdf_filter = 'pdf:writer_pdf_Export'
+            logger.info("🔖 Using custom profile for bookmark preservation")
+        
+        if user_installation is None:
+            user_installation = self.create_worker_profile()
+        
+        # Build command
+        cmd = [
+            self.libreoffice_cmd,
+            '--headless',
+            '--invisible', 
+            '--nodefault',
+            '--nolockcheck',
+            '--nologo',
+            '--norestore',
+            '--accept=socket,host=localhost,port=0;urp;StarOffice.ServiceManager',  # Add service manager
+            f'-env:UserInstallation={user_installation}',
+            '--convert-to', pdf_filter,
+            '--outdir', convert_temp,
+        ] + [os.path.abspath(input_path) for input_path in input_paths]
+        
+        logger.debug(f"Command: {' '.join(cmd)}")
+        return cmd
+    
+    def _check_soffice_result(self, returncode, stdout, stderr):
+        """Log lỗi LibreOffice; trả về True nếu process thành công"""
+        if returncode != 0:
+            logger.error(f"LibreOffice error (code {returncode}):")
+            logger.error(f"STDOUT: {stdout}")
+            logger.error(f"STDERR: {stderr}")
+            
+            # Try to provide helpful error messages
+            if "bootstrap.ini" in stderr.lower():
+                self.metrics.increment('bootstrap_ini_errors')
+                logger.error("💡 Suggestion: Restart your computer and try again")
+                logger.error("💡 Or manually delete LibreOffice temp profiles")
+            
+            return False
+        return True
+    
+    def _run_soffice_conversion(self, input_paths, convert_temp, timeout,
+                                user_installation=None):
+        """
+        Chạy một process soffice --convert-to cho một hoặc nhiều file input
+        Trả về thời gian conversion, hoặc None nếu LibreOffice báo lỗi
+        """
+        cmd = self._build_soffice_command(input_paths, convert_temp, user_installation)
+        
+        ticket, cgroup_dir = self._admit_conversion()
+        sampler = None
+        try:
+            logger.info("Running LibreOffice conversion...")
+            start_time = time.time()
+            
+            # Run conversion in its own process group
+            process = self._spawn_soffice(
+                cmd,
+                cgroup_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                cwd=convert_temp
+            )
+            sampler = self._start_memory_sampler(process.pid, ticket)
+            try:
+                with self.metrics.stage('subprocess'):
+                    stdout, stderr = process.communicate(timeout=timeout)
+            finally:
+                # Timeout: kill process group; thành công: dọn process con còn sót
+                with self.metrics.stage('process_cleanup'):
+                    self._terminate_soffice(process)
+        finally:
+            self._release_conversion(ticket, cgroup_dir, sampler)
+        
+        conversion_time = time.time() - start_time
+        
+        # Check result
+        if not self._check_soffice_result(process.returncode, stdout, stderr):
+            return None
+        
+        return conversion_time
+    
+    def pdf_filter_signature(self):
+        """PDF export settings thực tế được dùng (một phần của cache key)"""
+        if self._native_page_range():
+            settings = "options:" + json.dumps(self.pdf_export_options(), sort_keys=True)
+        else:
+            settings = "profile:" + PDF_EXPORT_REGISTRY_XCU
+            if self.current_page_range():
+                settings += f"\npages:{self.current_page_range()}"
+        return f"{self.libreoffice_version}\n{settings}"
+    
+    def _fetch_cached_pdf(self, input_path, output_path):
+        """
+        Tra PDF cache cho input
+        Returns:
+            (hit, key) - key dùng để store sau khi convert; None nếu cache tắt
+        """
+        if self.pdf_cache is None:
+            return False, None
+        key = self.pdf_cache.make_key(input_path, self.pdf_filter_signature())
+        if self.pdf_cache.fetch(key, output_path):
+            self.metrics.increment('cache_hits')
+            logger.info(f"⚡ Cache hit: {input_path} → {output_path}")
+            return True, key
+        return False, key
+    
+    def _finalize_output(self, temp_pdf_path, convert_temp, output_path,
+                         conversion_time, cache_key=None):
+        """Move PDF từ thư mục tạm tới output và lưu vào cache"""
+        # Find the created PDF
+        with self.metrics.stage('output_discovery'):
+            found = os.path.exists(temp_pdf_path)
+        if not found:
+            logger.error(f"PDF output not found: {temp_pdf_path}")
+            logger.error(f"Files in temp dir: {os.listdir(convert_temp)}")
+            return False
+        
+        # LibreOffice cũ không nhận PageRange qua CLI: render đủ rồi cắt trang
+        page_range = self.current_page_range()
+        if page_range and not self._native_page_range():
+            with self.metrics.stage('page_trim'):
+                try:
+                    pages = trim_pdf_pages(temp_pdf_path, page_range)
+                    logger.info(f"✂️  Trimmed PDF to pages {page_range} ({pages} pages)")
+                except ImportError:
+                    logger.warning("⚠️  Install PyPDF2 to export page ranges on this LibreOffice version")
+                    return False
+                except ValueError as e:
+                    logger.error(f"❌ {e}")
+                    return False
+        elif page_range and count_pdf_pages(temp_pdf_path) == 0:
+            # PageRange ngoài số trang của tài liệu: không cache/trả về PDF rỗng
+            logger.error(f"❌ Page range {page_range} selects no pages")
+            return False
+        
+        # Move to final location
+        with self.metrics.stage('move'):
+            shutil.move(temp_pdf_path, output_path)
+        
+        # Verify output
+        if os.path.exists(output_path):
+            file_size = os.path.getsize(output_path)
+            logger.info(f"✅ Conversion successful in {conversion_time:.2f}s")
+            logger.info(f"   Output: {output_path} ({file_size:,} bytes)")
+            if cache_key is not None:
+                self.pdf_cache.store(cache_key, output_path)
+            return True
+        else:
+            logger.error("Output file not created")
+            return False
+    
+    def _scratch_parent(self, input_paths, output_path=None):
+        """
+        Thư mục cha cho scratch dir (--outdir của soffice) khi bật staging:
+        output nằm trên filesystem khác tmpfs → scratch cạnh output để move chỉ là rename
+        (profiles vẫn ở tmpfs); không có output thì tmpfs nếu còn đủ chỗ, không thì disk temp
+        """
+        if not self.staging_root:
+            return self.temp_dir
+        if output_path:
+            output_dir = os.path.dirname(os.path.abspath(output_path))
+            if not same_filesystem(self.temp_dir, output_dir):
+                return output_dir
+        required = STAGING_MIN_FREE_BYTES
+        for path in input_paths:
+            try:
+                required += os.path.getsize(path) * STAGING_SIZE_FACTOR
+            except OSError:
+                pass
+        if free_bytes(self.temp_dir) >= required:
+            return self.temp_dir
+        logger.warning(f"⚠️  Not enough space on {self.staging_root}, staging on disk")
+        if output_path:
+            return os.path.dirname(os.path.abspath(output_path))
+        return self.disk_temp_dir
+    
+    def _make_scratch_dir(self, parent, kind):
+        """
+        Tạo scratch dir '<kind>_*' trong parent
+        Trong thư mục output thì để ẩn và ghi owner file như profile, để janitor dọn được
+        nếu process crash (temp dir của converter đã được cleanup() xoá cả cây)
+        """
+        if parent in (self.temp_dir, self.disk_temp_dir):
+            scratch = os.path.join(parent, f"{kind}_{int(time.time())}_{uuid.uuid4().hex[:6]}")
+            os.makedirs(scratch, exist_ok=True)
+            return scratch
+        scratch = os.path.join(parent, f".docx_{kind}_{int(time.time())}_{uuid.uuid4().hex[:6]}")
+        os.makedirs(scratch, exist_ok=True)
+        write_profile_owner(scratch)
+        register_live_profile(scratch)
+        if self.janitor is not None:
+            self.janitor.watch_scratch_dir(parent)
+        return scratch
+    
+    def _new_convert_temp(self, input_path, output_path=None):
+        """Tạo scratch dir cho một conversion; trả về (dir, đường dẫn PDF soffice sẽ ghi)"""
+        convert_temp = self._make_scratch_dir(self._scratch_parent([input_path], output_path), 'convert')
+        
+        input_filename = os.path.basename(input_path)
+        expected_pdf_name = os.path.splitext(input_filename)[0] + '.pdf'
+        return convert_temp, os.path.join(convert_temp, expected_pdf_name)
+    
+    def resolve_timeout(self, input_path, timeout=None):
+        """Timeout cho một file: giá trị truyền vào, hoặc ước lượng từ lịch sử conversion"""
+        if timeout is not None:
+            return timeout
+        if self.timing_model is None:
+            return DEFAULT_CONVERSION_TIMEOUT
+        try:
+            size_bytes, pages = self.timing_model.describe(input_path)
+        except OSError:
+            return DEFAULT_CONVERSION_TIMEOUT
+        return self.timing_model.timeout_for(size_bytes, pages)
+    
+    def estimate_conversion_time(self, input_path):
+        """Thời gian conversion dự kiến (giây) theo lịch sử, None nếu chưa đủ dữ liệu"""
+        if self.timing_model is None:
+            return None
+        try:
+            return self.timing_model.predict(*self.timing_model.describe(input_path))
+        except OSError:
+            return None
+    
+    def estimate_job_cost(self, input_path):
+        """Chi phí ước lượng (giây) cho shortest-job-first scheduling"""
+        return estimate_docx_cost(input_path, self.timing_model)
+    
+    def _record_timing(self, input_path, conversion_time):
+        # Export một phần tài liệu không phản ánh chi phí cả file
+        if self.timing_model is not None and self.current_page_range() is None:
+            try:
+                size_bytes, pages = self.timing_model.describe(input_path)
+                self.timing_model.record(size_bytes, pages, conversion_time)
+            except OSError:
+                pass
+    
+    def convert_single_file(self, input_path, output_path, timeout=None, priority_class=None,
+                            page_range=None, user_installation=None, enqueued_at=None):
+        """
+        Convert một file DOCX sang PDF với improved error handling
+        
+        Args:
+            timeout: Timeout (giây); None = ước lượng từ lịch sử conversion
+            priority_class: Override priority class của converter cho conversion này
+            page_range: Chỉ export các trang này ('1-3,5') hoặc N trang đầu (int), vd cho preview
+            user_installation: Profile URI dùng lại (từ create_worker_profile; None = profile mới)
+            enqueued_at: time.monotonic() lúc job vào queue của caller, để đo queue wait
+        """
+        with self.priority(priority_class), self.page_range(page_range):
+            return self._convert_file(input_path, output_path, timeout, user_installation, enqueued_at)
+    
+    def _count_result(self, success):
+        self.metrics.increment('conversions_success' if success else 'conversions_failed')
+        return success
+    
+    def _convert_file(self, input_path, output_path, timeout, user_installation=None,
+                      enqueued_at=None):
+        """
+        Conversion thực tế (có đếm success/failure và latency theo priority class vào metrics)
+        
+        Args:
+            user_installation: Profile URI dùng lại (mỗi worker song song có profile riêng)
+            enqueued_at: time.monotonic() lúc job vào queue (batch/service), để đo queue wait
+        """
+        started_at = time.monotonic()
+        try:
+            return self._count_result(
+                self._convert_file_coalesced(input_path, output_path, timeout, user_installation)
+            )
+        finally:
+            self._record_priority_stats(enqueued_at or started_at, started_at)
+    
+    def _inflight_key(self, input_path):
+        """Key để nhận diện conversion trùng: nội dung input + PDF settings"""
+        try:
+            return f"{hash_file(input_path)}:{self.pdf_filter_signature()}"
+        except OSError:
+            return None
+    
+    def _link_output(self, source_pdf, output_path):
+        """Đưa PDF đã convert tới output khác (reflink/hardlink/copy)"""
+        output_path = str(self.prepare_output_path(output_path))
+        if os.path.abspath(source_pdf) != os.path.abspath(output_path):
+            method = link_or_copy(source_pdf, output_path)
+            logger.info(f"🔗 {output_path} ← {source_pdf} ({method})")
+        return output_path
     
-    def convert_single_file(self, input_path, output_path, timeout=180):
+    def _convert_file_coalesced(self, input_path, output_path, timeout, user_installation=None):
         """
-        Convert một file DOCX sang PDF với improved error handling
+        Input trùng nội dung với conversion đang chạy ở thread khác: chờ conversion đó
+        và dùng lại PDF của nó; không thì tự convert (và làm leader cho các request trùng)
         """
+        key = self._inflight_key(input_path) if self.coalesce_inflight else None
+        if key is None:
+            return self._convert_file_core(input_path, output_path, timeout, user_installation)
+        
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            leader = entry is None
+            if leader:
+                entry = {"done": threading.Event(), "output": None, "success": False}
+                self._inflight[key] = entry
+        
+        if not leader:
+            logger.info(f"⏳ Identical document already converting, waiting: {input_path}")
+            entry["done"].wait()
+            self.metrics.increment('coalesced')
+            if not entry["success"]:
+                logger.error(f"❌ Conversion of identical document failed: {input_path}")
+                return False
+            try:
+                self._link_output(entry["output"], output_path)
+                return True
+            except OSError as e:
+                # PDF của leader đã bị move/xoá: tự convert
+                logger.warning(f"⚠️  Cannot reuse coalesced output: {e}")
+                return self._convert_file_core(input_path, output_path, timeout, user_installation)
+        
+        try:
+            success = self._convert_file_core(input_path, output_path, timeout, user_installation)
+            entry["output"] = str(self.prepare_output_path(output_path))
+            entry["success"] = success
+            return success
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            entry["done"].set()
+    
+    def _convert_file_core(self, input_path, output_path, timeout, user_installation=None):
         try:
             # Validate input
-            self.validate_input_file(input_path)
+            with self.metrics.stage('validation'):
+                self.validate_input_file(input_path)
+            timeout = self.resolve_timeout(input_path, timeout)
             output_path = self.prepare_output_path(output_path)
             
-            logger.info(f"🔄 Converting: {input_path} → {output_path}")
+            cache_hit, cache_key = self._fetch_cached_pdf(input_path, output_path)
+            if cache_hit:
+                return True
             
-            # Kill any existing LibreOffice processes
-            self.kill_existing_libreoffice_processes()
+            logger.info(f"🔄 Converting: {input_path} → {output_path}")
             
             # Tạo temp directory cho conversion này
-            convert_temp = os.path.join(self.temp_dir, f"convert_{int(time.time())}_{uuid.uuid4().hex[:6]}")
-            os.makedirs(convert_temp, exist_ok=True)
-            
-            # Prepare LibreOffice command
-            if self.supports_pdf_parameters:
-                # Modern LibreOffice: Use JSON parameters
-                pdf_filter = 'pdf:writer_pdf_Export:{"ExportBookmarks":{"type":"boolean","value":"true"},"ExportBookmarksToNamedDestinations":{"type":"boolean","value":"true"},"UseTaggedPDF":{"type":"boolean","value":"true"}}'
-                user_installation, _ = self.create_safe_profile_path()
-                logger.info("🔖 Using advanced PDF export with bookmark preservation")
-            else:
-                # Older LibreOffice: Use custom profile
-                pdf_filter = 'pdf:writer_pdf_Export'
-                user_installation = self.create_libreoffice_profile_with_pdf_settings()
-                logger.info("🔖 Using custom profile for bookmark preservation")
-            
-            # Build command
-            cmd = [
-                self.libreoffice_cmd,
-                '--headless',
-                '--invisible', 
-                '--nodefault',
-                '--nolockcheck',
-                '--nologo',
-                '--norestore',
-                '--accept=socket,host=localhost,port=0;urp;StarOffice.ServiceManager',  # Add service manager
-                f'-env:UserInstallation={user_installation}',
-                '--convert-to', pdf_filter,
-                '--outdir', convert_temp,
-                os.path.abspath(input_path)
-            ]
+            convert_temp, temp_pdf_path = self._new_convert_temp(input_path, output_path)
             
-            logger.info("Running LibreOffice conversion...")
-            logger.debug(f"Command: {' '.join(cmd)}")
+            self._await_warm_start()
+            pool = self.pool
+            if pool is None:
+                warm_pool = pool = self._take_warm_pool()
+            if pool is None and user_installation is None:
+                user_installation = self._take_warm_profile()
             
-            start_time = time.time()
+            if pool is not None:
+                # Worker pool: gửi conversion tới soffice instance đang chạy
+                logger.info("♻️  Using pooled LibreOffice instance")
+                start_time = time.time()
+                with self.metrics.stage('uno_conversion'):
+                    converted = pool.convert(input_path, temp_pdf_path, self.pdf_export_options(), timeout)
+                if not converted:
+                    return False
+                conversion_time = time.time() - start_time
+            else:
+                conversion_time = self._run_soffice_conversion(
+                    [input_path], convert_temp, timeout, user_installation
+                )
+                if conversion_time is None:
+                    return False
             
-            # Run conversion with improved error handling
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=convert_temp
+            success = self._finalize_output(
+                temp_pdf_path, convert_temp, output_path, conversion_time, cache_key
             )
-            
-            conversion_time = time.time() - start_time
-            
-            # Check result
-            if result.returncode != 0:
-                logger.error(f"LibreOffice error (code {result.returncode}):")
-                logger.error(f"STDOUT: {result.stdout}")
-                logger.error(f"STDERR: {result.stderr}")
-                
-                # Try to provide helpful error messages
-                if "bootstrap.ini" in result.stderr.lower():
-                    logger.error("💡 Suggestion: Restart your computer and try again")
-                    logger.error("💡 Or manually delete LibreOffice temp profiles")
-                
-                return False
-            
-            # Find the created PDF
-            input_filename = os.path.basename(input_path)
-            expected_pdf_name = os.path.splitext(input_filename)[0] + '.pdf'
-            temp_pdf_path = os.path.join(convert_temp, expected_pdf_name)
-            
-            if not os.path.exists(temp_pdf_path):
-                logger.error(f"PDF output not found: {temp_pdf_path}")
-                logger.error(f"Files in temp dir: {os.listdir(convert_temp)}")
-                return False
-            
-            # Move to final location
-            shutil.move(temp_pdf_path, output_path)
-            
-            # Verify output
-            if os.path.exists(output_path):
-                file_size = os.path.getsize(output_path)
-                logger.info(f"✅ Conversion successful in {conversion_time:.2f}s")
-                logger.info(f"   Output: {output_path} ({file_size:,} bytes)")
-                return True
-            else:
-                logger.error("Output file not created")
-                return False
+            if success:
+                self._record_timing(input_path, conversion_time)
+            return success
                 
         except subprocess.TimeoutExpired:
+            self.metrics.increment('conversions_timeout')
             logger.error(f"❌ Conversion timeout after {timeout} seconds")
-            # Kill LibreOffice processes on timeout
-            self.kill_existing_libreoffice_processes()
             return False
         except Exception as e:
             logger.error(f"❌ Conversion error: {str(e)}")
             return False
         finally:
             # Cleanup temp files for this conversion
-            if 'convert_temp' in locals() and os.path.exists(convert_temp):
-                shutil.rmtree(convert_temp, ignore_errors=True)
+            if 'convert_temp' in locals():
+                self._discard(convert_temp)
+            if 'warm_pool' in locals():
+                self._release_warm_pool(warm_pool)
     
     def verify_pdf_bookmarks(self, pdf_path, show_details=True):
         """
         Kiểm tra PDF có bookmark không với thông tin chi tiết
+        Chỉ đọc outline tree và named destinations (xem scan_pdf_outline)
         """
         try:
-            import PyPDF2
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
+            outline = scan_pdf_outline(pdf_path)
+            bookmark_count = outline["outline_items"]
+            
+            if bookmark_count > 0:
+                logger.info(
+                    f"✅ Found {bookmark_count} bookmarks in PDF "
+                    f"({outline['top_level']} top-level, depth {outline['max_depth']}, "
+                    f"{outline['named_destinations']} named destinations)"
+                )
                 
-                if hasattr(reader, 'outline') and reader.outline:
-                    bookmark_count = len(reader.outline)
-                    logger.info(f"✅ Found {bookmark_count} bookmarks in PDF")
-                    
-                    if show_details and bookmark_count > 0:
-                        # Print bookmark details
-                        def print_bookmarks(bookmarks, level=0):
-                            for i, bookmark in enumerate(bookmarks[:10]):  # Show max 10
-                                indent = "  " * level
-                                if hasattr(bookmark, 'title'):
-                                    logger.info(f"{indent}{i+1}. {bookmark.title}")
-                        
-                        print_bookmarks(reader.outline)
-                        if bookmark_count > 10:
-                            logger.info(f"   ... and {bookmark_count - 10} more bookmarks")
-                    
-                    return True
-                else:
-                    logger.warning("❌ No bookmarks found in PDF")
-                    logger.warning("   This may indicate:")
-                    logger.warning("   - Original DOCX has no bookmarks/headings")
-                    logger.warning("   - LibreOffice version issue")
-                    logger.warning("   - Headings not using proper styles")
-                    return False
+                if show_details:
+                    # Print bookmark details (max 10)
+                    for i, (depth, title) in enumerate(outline["titles"]):
+                        indent = "  " * (depth - 1)
+                        logger.info(f"{indent}{i+1}. {title}")
+                    if bookmark_count > len(outline["titles"]):
+                        logger.info(f"   ... and {bookmark_count - len(outline['titles'])} more bookmarks")
+                
+                return True
+            else:
+                logger.warning("❌ No bookmarks found in PDF")
+                logger.warning("   This may indicate:")
+                logger.warning("   - Original DOCX has no bookmarks/headings")
+                logger.warning("   - LibreOffice version issue")
+                logger.warning("   - Headings not using proper styles")
+                return False
                     
         except ImportError:
             logger.info("📝 Install PyPDF2 to verify bookmarks: pip install PyPDF2")
@@ -442,8 +2997,197 @@ class DocxToPdfConverter:
             logger.warning(f"Cannot verify bookmarks: {e}")
             return None
     
-    def batch_convert(self, input_dir, output_dir, pattern="*.docx"):
-        """Convert batch files with improved error handling"""
+    def _batch_file_result(self, docx_file, pdf_output, success):
+        """Verify bookmark (nếu thành công) và tạo file result cho batch"""
+        if success:
+            with self.metrics.stage('bookmark_verification'):
+                self.verify_pdf_bookmarks(str(pdf_output), show_details=False)
+        
+        return {
+            "input": str(docx_file),
+            "output": str(pdf_output),
+            "success": success
+        }
+    
+    def _batch_convert_one(self, index, total, docx_file, pdf_output,
+                           user_installation=None, enqueued_at=None):
+        """Convert + verify một file trong batch, trả về file result"""
+        logger.info(f"[{index}/{total}] Processing: {docx_file.name}")
+        
+        success = self._convert_file(
+            str(docx_file), str(pdf_output), None, user_installation, enqueued_at
+        )
+        
+        return self._batch_file_result(docx_file, pdf_output, success)
+    
+    @staticmethod
+    def _format_duration(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return f"{hours}h{minutes:02d}m"
+        return f"{minutes}m{seconds:02d}s"
+    
+    @staticmethod
+    def _make_chunks(jobs, chunk_size):
+        """
+        Chia jobs thành các nhóm tối đa chunk_size file
+        Tên file (stem) trong một nhóm phải unique vì soffice ghi chung một outdir
+        """
+        chunks = []
+        current = []
+        stems = set()
+        for job in jobs:
+            stem = job[1].stem.lower()
+            if len(current) >= chunk_size or stem in stems:
+                chunks.append(current)
+                current = []
+                stems = set()
+            current.append(job)
+            stems.add(stem)
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _batch_convert_chunk(self, chunk, total, user_installation=None, enqueued_at=None):
+        """
+        Convert một nhóm file bằng một lần gọi soffice
+        Thành công từng file được xác định bằng PDF output có xuất hiện hay không;
+        các file lỗi trong nhóm được convert lại từng file một
+        
+        Returns:
+            list file result theo thứ tự của chunk
+        """
+        names = ", ".join(docx_file.name for _, docx_file, _ in chunk)
+        logger.info(f"[{chunk[0][0]}-{chunk[-1][0]}/{total}] Processing chunk: {names}")
+        started_at = time.monotonic()
+        enqueued_at = enqueued_at or started_at
+        
+        outcomes = {}
+        cache_keys = {}
+        valid = []
+        for i, docx_file, pdf_output in chunk:
+            try:
+                with self.metrics.stage('validation'):
+                    self.validate_input_file(str(docx_file))
+                cache_hit, cache_keys[i] = self._fetch_cached_pdf(
+                    str(docx_file), self.prepare_output_path(str(pdf_output))
+                )
+                if cache_hit:
+                    outcomes[i] = self._count_result(True)
+                else:
+                    valid.append((i, docx_file, pdf_output))
+            except Exception as e:
+                logger.error(f"❌ Conversion error: {str(e)}")
+                outcomes[i] = self._count_result(False)
+        
+        retry = []
+        parent = self._scratch_parent(
+            [str(docx_file) for _, docx_file, _ in valid],
+            str(self.prepare_output_path(str(valid[0][2]))) if valid else None
+        )
+        convert_temp = self._make_scratch_dir(parent, 'chunk')
+        try:
+            completed = False
+            if valid:
+                # Timeout của chunk = tổng timeout ước lượng của từng file
+                timeout = sum(self.resolve_timeout(str(docx_file)) for _, docx_file, _ in valid)
+                try:
+                    conversion_time = self._run_soffice_conversion(
+                        [str(docx_file) for _, docx_file, _ in valid],
+                        convert_temp, timeout, user_installation
+                    )
+                    completed = True
+                    if conversion_time is not None:
+                        logger.info(f"✅ Chunk of {len(valid)} files converted in {conversion_time:.2f}s")
+                except subprocess.TimeoutExpired:
+                    # PDF cuối cùng có thể ghi dở, không dùng output nào của lần chạy này
+                    self.metrics.increment('conversions_timeout')
+                    logger.error(f"❌ Chunk timeout after {timeout} seconds")
+                except Exception as e:
+                    logger.error(f"❌ Chunk conversion error: {str(e)}")
+            
+            for i, docx_file, pdf_output in valid:
+                temp_pdf_path = os.path.join(convert_temp, docx_file.stem + '.pdf')
+                with self.metrics.stage('output_discovery'):
+                    found = completed and os.path.exists(temp_pdf_path)
+                if found:
+                    final_pdf = self.prepare_output_path(str(pdf_output))
+                    with self.metrics.stage('move'):
+                        shutil.move(temp_pdf_path, final_pdf)
+                    if cache_keys.get(i) is not None:
+                        self.pdf_cache.store(cache_keys[i], final_pdf)
+                    outcomes[i] = self._count_result(True)
+                else:
+                    retry.append((i, docx_file, pdf_output))
+        finally:
+            self._discard(convert_temp)
+        
+        if retry:
+            logger.warning(f"⚠️  {len(retry)} file(s) missing from chunk output, converting individually")
+            for i, docx_file, pdf_output in retry:
+                outcomes[i] = self._convert_file(
+                    str(docx_file), str(pdf_output), None, user_installation, enqueued_at
+                )
+        
+        retried = {i for i, _, _ in retry}
+        for i, _, _ in chunk:
+            if i not in retried:
+                self._record_priority_stats(enqueued_at, started_at)
+        
+        return [
+            self._batch_file_result(docx_file, pdf_output, outcomes[i])
+            for i, docx_file, pdf_output in chunk
+        ]
+    
+    def _coalesce_duplicate_jobs(self, jobs):
+        """
+        Gom các input trùng nội dung (SHA-256)
+        Returns:
+            (jobs chỉ gồm file đầu tiên của mỗi nội dung, {index job giữ lại: [job trùng]})
+        """
+        unique = []
+        duplicates = {}
+        first_by_hash = {}
+        for job in jobs:
+            try:
+                digest = hash_file(job[1])
+            except OSError:
+                unique.append(job)  # Lỗi đọc file sẽ được báo khi validate
+                continue
+            if digest in first_by_hash:
+                duplicates.setdefault(first_by_hash[digest], []).append(job)
+            else:
+                first_by_hash[digest] = job[0]
+                unique.append(job)
+        if duplicates:
+            count = sum(len(dups) for dups in duplicates.values())
+            logger.info(f"🔗 {count} duplicate file(s) will reuse the PDF of an identical input")
+        return unique, duplicates
+    
+    def _expand_duplicate_results(self, unit, unit_result, duplicates):
+        """Thêm file result cho các input trùng với các job trong unit"""
+        results = list(unit_result)
+        for (i, docx_file, pdf_output), file_result in zip(unit, unit_result):
+            for _, dup_file, dup_output in duplicates.get(i, []):
+                success = file_result["success"]
+                if success:
+                    try:
+                        self._link_output(str(pdf_output), str(dup_output))
+                    except OSError as e:
+                        logger.error(f"❌ Cannot create {dup_output}: {e}")
+                        success = False
+                self.metrics.increment('coalesced')
+                results.append({
+                    "input": str(dup_file),
+                    "output": str(dup_output),
+                    "success": success,
+                    "duplicate_of": str(docx_file),
+                })
+        return results
+    
+    def _batch_jobs(self, input_dir, output_dir, pattern):
+        """Danh sách job (index, docx_file, pdf_output) cho batch"""
         input_path = Path(input_dir)
         output_path = Path(output_dir)
         
@@ -456,37 +3200,410 @@ class DocxToPdfConverter:
         
         if not docx_files:
             logger.warning(f"No DOCX files found in {input_dir}")
-            return {"success": 0, "failed": 0, "files": []}
+            return []
         
         logger.info(f"Found {len(docx_files)} DOCX files to convert")
         
+        return [
+            (i, docx_file, output_path / (docx_file.stem + '.pdf'))
+            for i, docx_file in enumerate(docx_files, 1)
+        ]
+    
+    def iter_batch_convert(self, input_dir, output_dir, pattern="*.docx", max_workers=1,
+                           chunk_size=1, manifest_path=None, retry_failed=False,
+                           progress_log=None, schedule='fifo', priority_class=None,
+                           coalesce_duplicates=True):
+        """
+        Generator version của batch_convert: yield file result ngay khi file convert xong
+        (theo thứ tự hoàn thành khi chạy song song)
+        
+        Args:
+            progress_log: File JSONL append-only, mỗi dòng là một file result kèm timestamp
+        """
+        jobs = self._batch_jobs(input_dir, output_dir, pattern)
+        return self._iter_batch_jobs(
+            jobs, max_workers, chunk_size, manifest_path, retry_failed, progress_log, schedule,
+            priority_class, coalesce_duplicates
+        )
+    
+    def _iter_batch_jobs(self, jobs, max_workers=1, chunk_size=1, manifest_path=None,
+                         retry_failed=False, progress_log=None, schedule='fifo',
+                         priority_class=None, coalesce_duplicates=True):
+        total = len(jobs)
+        started = time.time()
+        enqueued_at = time.monotonic()
+        completed = 0
+        
+        def emit(file_result):
+            nonlocal completed
+            completed += 1
+            if progress_log:
+                append_jsonl(progress_log, dict(
+                    file_result,
+                    completed=completed,
+                    total=total,
+                    elapsed=round(time.time() - started, 3),
+                    time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                ))
+            return file_result
+        
+        manifest = BatchManifest(manifest_path) if manifest_path else None
+        if manifest is not None:
+            pending = []
+            skipped = 0
+            for job in jobs:
+                i, docx_file, pdf_output = job
+                previous = manifest.lookup(docx_file, pdf_output, retry_failed)
+                if previous is None:
+                    pending.append(job)
+                else:
+                    skipped += 1
+                    yield emit({
+                        "input": str(docx_file),
+                        "output": str(pdf_output),
+                        "success": previous,
+                        "skipped": True
+                    })
+            if skipped:
+                logger.info(f"📒 Skipping {skipped} file(s) already in manifest")
+            jobs = pending
+        
+        duplicates = {}
+        if coalesce_duplicates:
+            jobs, duplicates = self._coalesce_duplicate_jobs(jobs)
+        
+        if schedule == 'sjf':
+            # Cả batch đến cùng lúc nên aging không đổi thứ tự: sắp xếp theo cost là đủ.
+            # Workers lấy unit theo thứ tự submit; chunk gom các file cỡ tương đương
+            costs = {i: self.estimate_job_cost(str(docx_file)) for i, docx_file, _ in jobs}
+            jobs = sorted(jobs, key=lambda job: (costs[job[0]], job[0]))
+            logger.info("📐 Shortest-job-first scheduling")
+        elif schedule != 'fifo':
+            raise ValueError(f"Unknown schedule: {schedule}")
+        
+        if chunk_size > 1 and self.pool is None:
+            units = self._make_chunks(jobs, chunk_size)
+            logger.info(f"📦 Chunked mode: {len(units)} soffice invocations for {len(jobs)} files")
+        else:
+            units = [[job] for job in jobs]
+        
+        if not units:
+            return
+        
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, len(units)))
+        
+        # ETA theo lịch sử conversion (chỉ khi model đã đủ dữ liệu)
+        estimates = {i: self.estimate_conversion_time(str(docx_file)) for i, docx_file, _ in jobs}
+        eta = None
+        if None not in estimates.values():
+            eta = {"remaining": sum(estimates.values()), "lock": threading.Lock()}
+            logger.info(f"⏱️  Estimated batch time: {self._format_duration(eta['remaining'] / max_workers)}")
+        
+        worker_state = threading.local()
+        
+        def run(unit):
+            # Context (priority class) không truyền sang worker thread, set lại trong thread
+            with self.priority(priority_class):
+                if self.pool is None and not hasattr(worker_state, 'profile'):
+                    worker_state.profile = self.create_worker_profile()
+                profile = getattr(worker_state, 'profile', None)
+                if len(unit) > 1:
+                    unit_result = self._batch_convert_chunk(
+                        unit, total, user_installation=profile, enqueued_at=enqueued_at
+                    )
+                else:
+                    i, docx_file, pdf_output = unit[0]
+                    unit_result = [self._batch_convert_one(
+                        i, total, docx_file, pdf_output,
+                        user_installation=profile, enqueued_at=enqueued_at
+                    )]
+            if duplicates:
+                unit_result = self._expand_duplicate_results(unit, unit_result, duplicates)
+            if manifest is not None:
+                for file_result in unit_result:
+                    manifest.record(file_result["input"], file_result["output"], file_result["success"])
+            if eta is not None:
+                with eta["lock"]:
+                    eta["remaining"] -= sum(estimates[job[0]] for job in unit)
+                    remaining = max(0.0, eta["remaining"]) / max_workers
+                logger.info(f"⏱️  ETA: {self._format_duration(remaining)}")
+            return unit_result
+        
+        if max_workers == 1:
+            for unit in units:
+                for file_result in run(unit):
+                    yield emit(file_result)
+            return
+        
+        logger.info(f"⚡ Running {max_workers} conversions in parallel")
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(run, unit) for unit in units]
+            for future in as_completed(futures):
+                for file_result in future.result():
+                    yield emit(file_result)
+        finally:
+            # Consumer dừng sớm: bỏ các unit chưa chạy, chờ các conversion đang chạy
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def batch_convert(self, input_dir, output_dir, pattern="*.docx", max_workers=1,
+                      chunk_size=1, manifest_path=None, retry_failed=False,
+                      progress_log=None, schedule='fifo', priority_class=None,
+                      coalesce_duplicates=True):
+        """
+        Convert batch files with improved error handling
+        
+        Args:
+            max_workers: Số conversion chạy song song (None = số CPU core).
+                Mỗi worker dùng profile LibreOffice riêng.
+            chunk_size: Số file truyền vào một lần gọi soffice (> 1 để bật chunked mode,
+                không áp dụng khi dùng worker pool)
+            manifest_path: File JSONL ghi kết quả từng file; chạy lại sẽ skip các file
+                đã convert và output còn nguyên (incremental/resume)
+            retry_failed: Convert lại các file đã failed trong manifest
+            progress_log: File JSONL append-only ghi tiến độ từng file
+            schedule: 'fifo' (thứ tự glob) hoặc 'sjf' (file ước lượng nhanh nhất chạy trước,
+                giảm thời gian chờ trung bình khi batch lẫn file lớn và nhỏ)
+            priority_class: Priority class cho soffice của batch (vd 'bulk')
+            coalesce_duplicates: File trùng nội dung chỉ convert một lần, các output còn lại
+                được reflink/hardlink/copy từ PDF đó
+        """
+        jobs = self._batch_jobs(input_dir, output_dir, pattern)
+        
         results = {"success": 0, "failed": 0, "files": []}
         
-        for i, docx_file in enumerate(docx_files, 1):
-            pdf_filename = docx_file.stem + '.pdf'
-            pdf_output = output_path / pdf_filename
+        if not jobs:
+            return results
+        
+        input_order = {str(docx_file): i for i, docx_file, _ in jobs}
+        file_results = sorted(
+            self._iter_batch_jobs(
+                jobs, max_workers, chunk_size, manifest_path, retry_failed, progress_log,
+                schedule, priority_class, coalesce_duplicates
+            ),
+            key=lambda r: input_order[r["input"]]
+        )
+        for file_result in file_results:
+            if file_result["success"]:
+                results["success"] += 1
+            else:
+                results["failed"] += 1
+            
+            results["files"].append(file_result)
+        
+        # Summary
+        total = results["success"] + results["failed"]
+        skipped = sum(1 for r in results["files"] if r.get("skipped"))
+        logger.info(f"\n📊 Batch conversion completed:")
+        logger.info(f"   ✅ Success: {results['success']}/{total}")
+        logger.info(f"   ❌ Failed:  {results['failed']}/{total}")
+        if skipped:
+            logger.info(f"   📒 Skipped (manifest): {skipped}/{total}")
+        if self.pdf_cache is not None:
+            cache_stats = self.pdf_cache.stats()
+            logger.info(f"   ⚡ Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        
+        return results
+    
+    async def _async_run_soffice_conversion(self, input_path, convert_temp, timeout,
+                                            user_installation=None):
+        """
+        Bản asyncio của _run_soffice_conversion
+        Process bị kill khi timeout hoặc khi task bị cancel
+        """
+        if user_installation is None:
+            user_installation = await asyncio.to_thread(self.create_worker_profile)
+        cmd = self._build_soffice_command([input_path], convert_temp, user_installation)
+        
+        ticket, cgroup_dir = await asyncio.to_thread(self._admit_conversion)
+        sampler = None
+        try:
+            if self.system == 'windows':
+                group_kwargs = {'creationflags': self._priority_creationflags()}
+            else:
+                group_kwargs = {'start_new_session': True}
+                cmd = self._wrap_soffice_command(cmd, cgroup_dir)
+            
+            logger.info("Running LibreOffice conversion (async)...")
+            start_time = time.time()
+            
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=convert_temp,
+                **group_kwargs
+            )
+            with self._process_lock:
+                self._async_processes.add(process)
+            sampler = self._start_memory_sampler(process.pid, ticket)
+            try:
+                with self.metrics.stage('subprocess'):
+                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            finally:
+                # Timeout/cancel: kill process group; thành công: dọn process con còn sót
+                with self.metrics.stage('process_cleanup'):
+                    await terminate_async_process_group(process)
+                with self._process_lock:
+                    self._async_processes.discard(process)
+        finally:
+            self._release_conversion(ticket, cgroup_dir, sampler)
+        
+        conversion_time = time.time() - start_time
+        
+        stdout = stdout.decode('utf-8', errors='replace')
+        stderr = stderr.decode('utf-8', errors='replace')
+        if not self._check_soffice_result(process.returncode, stdout, stderr):
+            return None
+        
+        return conversion_time
+    
+    async def async_convert_single_file(self, input_path, output_path, timeout=None,
+                                        user_installation=None, priority_class=None,
+                                        page_range=None):
+        """
+        Async counterpart của convert_single_file (asyncio.create_subprocess_exec)
+        Không block event loop; cancel task sẽ kill soffice process của conversion này
+        
+        Args:
+            timeout: Timeout cho conversion này (giây); None = ước lượng từ lịch sử
+            user_installation: Profile URI dùng lại (None = tạo profile mới)
+            priority_class: Override priority class của converter cho conversion này
+            page_range: Chỉ export các trang này ('1-3,5') hoặc N trang đầu (int)
+        """
+        started_at = time.monotonic()
+        with self.priority(priority_class), self.page_range(page_range):
+            try:
+                return self._count_result(await self._async_convert_file_core(
+                    input_path, output_path, timeout, user_installation
+                ))
+            finally:
+                self._record_priority_stats(started_at, started_at)
+    
+    async def _async_convert_file_core(self, input_path, output_path, timeout, user_installation):
+        convert_temp = None
+        warm_pool = None
+        try:
+            # Validate input
+            with self.metrics.stage('validation'):
+                self.validate_input_file(input_path)
+            timeout = self.resolve_timeout(input_path, timeout)
+            output_path = self.prepare_output_path(output_path)
             
-            logger.info(f"[{i}/{len(docx_files)}] Processing: {docx_file.name}")
+            cache_hit, cache_key = await asyncio.to_thread(
+                self._fetch_cached_pdf, input_path, output_path
+            )
+            if cache_hit:
+                return True
             
-            success = self.convert_single_file(str(docx_file), str(pdf_output))
+            logger.info(f"🔄 Converting (async): {input_path} → {output_path}")
             
-            file_result = {
-                "input": str(docx_file),
-                "output": str(pdf_output),
-                "success": success
-            }
+            convert_temp, temp_pdf_path = self._new_convert_temp(input_path, output_path)
+            
+            await asyncio.to_thread(self._await_warm_start)
+            pool = self.pool
+            if pool is None:
+                warm_pool = pool = self._take_warm_pool()
+            if pool is None and user_installation is None:
+                user_installation = self._take_warm_profile()
             
+            if pool is not None:
+                # UNO call là blocking, chạy trong thread; pool tự kill worker khi timeout
+                logger.info("♻️  Using pooled LibreOffice instance")
+                start_time = time.time()
+                with self.metrics.stage('uno_conversion'):
+                    converted = await asyncio.to_thread(
+                        pool.convert, input_path, temp_pdf_path, self.pdf_export_options(), timeout
+                    )
+                if not converted:
+                    return False
+                conversion_time = time.time() - start_time
+            else:
+                conversion_time = await self._async_run_soffice_conversion(
+                    input_path, convert_temp, timeout, user_installation
+                )
+                if conversion_time is None:
+                    return False
+            
+            success = await asyncio.to_thread(
+                self._finalize_output,
+                temp_pdf_path, convert_temp, output_path, conversion_time, cache_key
+            )
             if success:
+                self._record_timing(input_path, conversion_time)
+            return success
+        
+        except (asyncio.TimeoutError, subprocess.TimeoutExpired):
+            self.metrics.increment('conversions_timeout')
+            logger.error(f"❌ Conversion timeout after {timeout} seconds")
+            return False
+        except asyncio.CancelledError:
+            logger.warning(f"⚠️  Conversion cancelled: {input_path}")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Conversion error: {str(e)}")
+            return False
+        finally:
+            if convert_temp:
+                self._discard(convert_temp)
+            self._release_warm_pool(warm_pool)
+    
+    async def async_batch_convert(self, input_dir, output_dir, pattern="*.docx",
+                                  concurrency=4, timeout=None):
+        """
+        Async batch conversion, tối đa `concurrency` soffice chạy cùng lúc
+        Mỗi slot concurrency dùng một profile LibreOffice riêng
+        """
+        input_path = Path(input_dir)
+        output_path = Path(output_dir)
+        
+        if not input_path.exists():
+            raise FileNotFoundError(f"Input directory not found: {input_dir}")
+        
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        docx_files = list(input_path.glob(pattern))
+        
+        if not docx_files:
+            logger.warning(f"No DOCX files found in {input_dir}")
+            return {"success": 0, "failed": 0, "files": []}
+        
+        logger.info(f"Found {len(docx_files)} DOCX files to convert (async, concurrency={concurrency})")
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        profiles = asyncio.Queue()
+        for _ in range(min(concurrency, len(docx_files))):
+            profile = None if self.pool is not None else await asyncio.to_thread(self.create_worker_profile)
+            profiles.put_nowait(profile)
+        
+        async def run(i, docx_file):
+            pdf_output = output_path / (docx_file.stem + '.pdf')
+            async with semaphore:
+                profile = await profiles.get()
+                try:
+                    logger.info(f"[{i}/{len(docx_files)}] Processing: {docx_file.name}")
+                    success = await self.async_convert_single_file(
+                        str(docx_file), str(pdf_output), timeout, user_installation=profile
+                    )
+                finally:
+                    profiles.put_nowait(profile)
+            return await asyncio.to_thread(self._batch_file_result, docx_file, pdf_output, success)
+        
+        file_results = await asyncio.gather(
+            *(run(i, docx_file) for i, docx_file in enumerate(docx_files, 1))
+        )
+        
+        results = {"success": 0, "failed": 0, "files": list(file_results)}
+        for file_result in file_results:
+            if file_result["success"]:
                 results["success"] += 1
-                self.verify_pdf_bookmarks(str(pdf_output), show_details=False)
             else:
                 results["failed"] += 1
-            
-            results["files"].append(file_result)
         
-        # Summary
         total = results["success"] + results["failed"]
-        logger.info(f"\n📊 Batch conversion completed:")
+        logger.info(f"\n📊 Async batch conversion completed:")
         logger.info(f"   ✅ Success: {results['success']}/{total}")
         logger.info(f"   ❌ Failed:  {results['failed']}/{total}")
         
@@ -494,19 +3611,43 @@ class DocxToPdfConverter:
     
     def cleanup(self):
         """Enhanced cleanup"""
+        # Warm-up đang chạy có thể vừa tạo pool
+        self._await_warm_start()
+        
+        # Stop pooled LibreOffice instances
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        with self._process_lock:
+            warm_pool, self._warm_pool = self._warm_pool, None
+        if warm_pool is not None:
+            warm_pool.shutdown()
+        
+        # Terminate LibreOffice processes started by this converter
+        # (trước khi xoá profile mà chúng còn đang ghi)
+        self.terminate_owned_processes()
+        
         # Cleanup temp directory
         if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self._discard(self.temp_dir)
             logger.info(f"Temp directory cleaned up: {self.temp_dir}")
+        if self.disk_temp_dir and self.disk_temp_dir != self.temp_dir:
+            self._discard(self.disk_temp_dir)
         
         # Cleanup active profiles
         for profile_dir in self.active_profiles:
-            if os.path.exists(profile_dir):
-                shutil.rmtree(profile_dir, ignore_errors=True)
-                logger.debug(f"Profile cleaned up: {profile_dir}")
-        
-        # Kill any remaining LibreOffice processes
-        self.kill_existing_libreoffice_processes()
+            unregister_live_profile(profile_dir)
+            self._discard(profile_dir)
+            logger.debug(f"Profile cleaned up: {profile_dir}")
+        self.active_profiles = []
+    
+    def _discard(self, path):
+        """Xoá scratch dir/profile: qua janitor thread nếu bật background_cleanup"""
+        unregister_live_profile(path)
+        if self.janitor is not None:
+            self.janitor.discard(path)
+        elif os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
     
     def __enter__(self):
         return self
@@ -514,23 +3655,353 @@ class DocxToPdfConverter:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.cleanup()
 
+class HotFolderDaemon:
+    """
+    Watch các thư mục input (inotify), convert DOCX mới bằng pool worker có giới hạn
+    PDF ghi vào thư mục 'output', file lỗi move sang 'failed' (cùng cấp với thư mục input)
+    Không có inotify (Windows/macOS) thì fallback sang quét định kỳ
+    Với inotify, file chỉ được convert sau IN_CLOSE_WRITE/IN_MOVED_TO (upload đã xong);
+    file vừa mới sửa mà preflight báo truncated/not_zip được coi là chưa upload xong
+    (chờ tiếp) thay vì move sang 'failed' cho tới khi đứng yên quá stall_grace giây
+    File nhỏ được convert trước (shortest-job-first), aging = giây cost được trừ
+    cho mỗi giây chờ để file lớn không bị bỏ đói
+    """
+
+    def __init__(self, input_dirs, output_dir=None, failed_dir=None, workers=2,
+                 debounce=2.0, converter_kwargs=None, aging=1.0, stall_grace=60.0):
+        self.input_dirs = [os.path.abspath(d) for d in input_dirs]
+        self.output_dir = output_dir
+        self.failed_dir = failed_dir
+        self.workers = max(1, workers)
+        self.debounce = debounce
+        self.converter_kwargs = converter_kwargs or {}
+        self.aging = aging
+        self.stall_grace = stall_grace
+        self.stats = {"success": 0, "failed": 0}
+        # path -> (thời điểm event cuối, size lúc đó, writer đã close file chưa)
+        self._pending = {}
+        self._first_seen = {}  # path -> thời điểm phát hiện (cho aging)
+        self._costs = {}  # path -> (size, cost SJF) đã tính
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._queue = queue.PriorityQueue(maxsize=self.workers * 2)
+        self._stop = threading.Event()
+        self.startup_error = None  # Exception khi worker không khởi tạo được converter
+
+    def _sibling_dir(self, input_dir, explicit, name):
+        if explicit:
+            return explicit
+        return os.path.join(os.path.dirname(input_dir), name)
+
+    def output_dir_for(self, input_dir):
+        return self._sibling_dir(input_dir, self.output_dir, 'output')
+
+    def failed_dir_for(self, input_dir):
+        return self._sibling_dir(input_dir, self.failed_dir, 'failed')
+
+    @staticmethod
+    def _is_candidate(name):
+        # Bỏ qua file ẩn, file tạm khi upload và lock file của Word (~$...)
+        return name.lower().endswith('.docx') and not name.startswith(('.', '~$'))
+
+    def _note(self, path, closed=True):
+        """
+        Ghi nhận file vừa thay đổi; chỉ dispatch khi file đứng yên đủ debounce
+        closed=False (IN_MODIFY): writer còn mở file, chờ IN_CLOSE_WRITE/IN_MOVED_TO
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pending[path] = (now, size, closed)
+            self._first_seen.setdefault(path, now)
+
+    def _initial_scan(self):
+        """File đã có sẵn khi khởi động (bỏ qua file đã có PDF mới hơn)"""
+        for input_dir in self.input_dirs:
+            output_dir = self.output_dir_for(input_dir)
+            for name in sorted(os.listdir(input_dir)):
+                if not self._is_candidate(name):
+                    continue
+                path = os.path.join(input_dir, name)
+                pdf_path = os.path.join(output_dir, os.path.splitext(name)[0] + '.pdf')
+                try:
+                    if os.path.getmtime(pdf_path) >= os.path.getmtime(path):
+                        continue
+                except OSError:
+                    pass
+                self._note(path)
+
+    def _poll_scan(self, snapshot):
+        """Fallback không có inotify: phát hiện file mới/thay đổi theo (size, mtime)"""
+        for input_dir in self.input_dirs:
+            for name in os.listdir(input_dir):
+                if not self._is_candidate(name):
+                    continue
+                path = os.path.join(input_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                state = (st.st_size, st.st_mtime)
+                if snapshot.get(path) != state:
+                    snapshot[path] = state
+                    self._note(path)
+
+    def _cost_for(self, path, size):
+        """Cost SJF của file, chỉ đọc zip một lần cho mỗi (path, size)"""
+        with self._lock:
+            cached = self._costs.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        cost = estimate_docx_cost(path)
+        with self._lock:
+            self._costs[path] = (size, cost)
+        return cost
+
+    def _forget(self, path):
+        self._pending.pop(path, None)
+        self._first_seen.pop(path, None)
+        self._costs.pop(path, None)
+
+    def _queue_item(self, priority, path):
+        with self._lock:
+            self._sequence += 1
+            return (priority, self._sequence, path)
+
+    def _dispatch_ready(self):
+        """
+        Đưa file đã ổn định (hết debounce, size không đổi) vào queue của workers,
+        theo thứ tự shortest-job-first có aging
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (path, noted_at, size) for path, (noted_at, size, closed) in self._pending.items()
+                if closed and now - noted_at >= self.debounce and path not in self._inflight
+            ]
+        ready = []
+        for path, noted_at, size in candidates:
+            try:
+                current = os.path.getsize(path)
+            except OSError:
+                with self._lock:
+                    self._forget(path)
+                continue
+            if current != size:
+                # Vẫn đang được ghi
+                with self._lock:
+                    self._pending[path] = (now, current, True)
+                continue
+            with self._lock:
+                first_seen = self._first_seen.get(path, noted_at)
+            priority = sjf_priority(self._cost_for(path, size), first_seen, self.aging)
+            ready.append((priority, path, noted_at))
+        for priority, path, noted_at in sorted(ready):
+            try:
+                self._queue.put_nowait(self._queue_item(priority, path))
+            except queue.Full:
+                return  # Workers đang bận, thử lại ở vòng sau
+            with self._lock:
+                if self._pending.get(path, (None,))[0] == noted_at:
+                    self._forget(path)
+                self._inflight.add(path)
+
+    def _move_to_failed(self, path, reason):
+        failed_dir = self.failed_dir_for(os.path.dirname(path))
+        os.makedirs(failed_dir, exist_ok=True)
+        target = os.path.join(failed_dir, os.path.basename(path))
+        shutil.move(path, target)
+        with open(target + '.error.txt', 'w', encoding='utf-8') as f:
+            f.write(reason + '\n')
+        logger.error(f"❌ {os.path.basename(path)} → {failed_dir} ({reason})")
+
+    def _worker_failed(self, error):
+        """Worker không start được (vd không có LibreOffice): dừng cả daemon"""
+        logger.error(f"❌ Hot folder worker cannot start: {error!r}")
+        with self._lock:
+            if self.startup_error is None:
+                self.startup_error = error
+        self._stop.set()
+
+    def _worker(self):
+        try:
+            converter = DocxToPdfConverter(**self.converter_kwargs)
+        except (Exception, SystemExit) as e:
+            # DocxToPdfConverter gọi sys.exit khi thiếu LibreOffice
+            self._worker_failed(e)
+            return
+        with converter:
+            try:
+                # Một profile cho mỗi worker, dùng lại cho mọi file
+                profile = converter.create_worker_profile()
+            except Exception as e:
+                self._worker_failed(e)
+                return
+            while True:
+                _, _, path = self._queue.get()
+                if path is None:
+                    break
+                try:
+                    input_dir = os.path.dirname(path)
+                    preflight = preflight_docx(path)
+                    if not preflight["ok"] and self._still_uploading(path, preflight):
+                        # Upload bị ngắt quãng lâu hơn debounce: chờ tiếp, không fail
+                        logger.info(f"⏳ {os.path.basename(path)} looks incomplete, waiting")
+                        self._note(path)
+                        continue
+                    if not preflight["ok"]:
+                        self._move_to_failed(path, f"{preflight['reason']}: {preflight['detail']}")
+                        success = False
+                    else:
+                        pdf_path = os.path.join(
+                            self.output_dir_for(input_dir),
+                            os.path.splitext(os.path.basename(path))[0] + '.pdf'
+                        )
+                        success = converter.convert_single_file(
+                            path, pdf_path, user_installation=profile
+                        )
+                        if not success:
+                            self._move_to_failed(path, "conversion failed")
+                    with self._lock:
+                        self.stats["success" if success else "failed"] += 1
+                except Exception as e:
+                    logger.error(f"❌ Hot folder worker error for {path}: {e}")
+                finally:
+                    with self._lock:
+                        self._inflight.discard(path)
+
+    def _still_uploading(self, path, preflight):
+        """Zip chưa đọc được và file vừa được ghi gần đây → nhiều khả năng upload chưa xong"""
+        if preflight["reason"] not in ('truncated', 'not_zip'):
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) < self.stall_grace
+        except OSError:
+            return False
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Chạy tới khi stop() được gọi (hoặc Ctrl+C)"""
+        for input_dir in self.input_dirs:
+            os.makedirs(input_dir, exist_ok=True)
+
+        watcher = None
+        try:
+            watcher = InotifyWatcher()
+            for input_dir in self.input_dirs:
+                watcher.add_watch(input_dir)
+            logger.info(f"👀 Watching (inotify): {', '.join(self.input_dirs)}")
+        except OSError as e:
+            if watcher is not None:
+                watcher.close()
+            watcher = None
+            logger.warning(f"⚠️  {e}; falling back to polling")
+
+        threads = [
+            threading.Thread(target=self._worker, name=f"hotfolder-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        snapshot = {}
+        tick = max(0.1, min(self.debounce / 2, 1.0))
+        try:
+            self._initial_scan()
+            while not self._stop.is_set():
+                if watcher is not None:
+                    for directory, name, mask in watcher.read_events(tick):
+                        if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                            self._initial_scan()  # Mất event: quét lại toàn bộ
+                        elif directory and self._is_candidate(name):
+                            closed = bool(mask & (InotifyWatcher.IN_CLOSE_WRITE |
+                                                  InotifyWatcher.IN_MOVED_TO))
+                            self._note(os.path.join(directory, name), closed)
+                else:
+                    self._stop.wait(tick)
+                    self._poll_scan(snapshot)
+                self._dispatch_ready()
+        except KeyboardInterrupt:
+            logger.info("🛑 Stopping hot folder daemon")
+        finally:
+            # Sentinel cho từng worker còn sống; worker đã chết không lấy từ queue nữa
+            for thread in threads:
+                while thread.is_alive():
+                    try:
+                        self._queue.put(self._queue_item(float('inf'), None), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+            for thread in threads:
+                thread.join()
+            if watcher is not None:
+                watcher.close()
+        if self.startup_error is not None:
+            raise RuntimeError(f"Hot folder worker failed to start: {self.startup_error!r}")
+        return self.stats
+
+
+def watch_folders(input_dirs, output_dir=None, failed_dir=None, workers=2, debounce=2.0):
+    """Chạy hot folder daemon tới khi nhận SIGTERM/SIGINT"""
+    daemon = HotFolderDaemon(input_dirs, output_dir, failed_dir, workers, debounce)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    return daemon.run()
+
+
 # Convenience functions
 def convert_docx_to_pdf(input_path, output_path):
     """Simple conversion function"""
     with DocxToPdfConverter() as converter:
         return converter.convert_single_file(input_path, output_path)
 
-def batch_convert_docx_to_pdf(input_dir, output_dir):
-    """Simple batch conversion function"""
+def preview_docx_to_pdf(input_path, output_path, pages=3):
+    """PDF chỉ gồm vài trang đầu (preview cho document viewer)"""
     with DocxToPdfConverter() as converter:
-        return converter.batch_convert(input_dir, output_dir)
+        return converter.convert_single_file(input_path, output_path, page_range=pages)
+
+def batch_convert_docx_to_pdf(input_dir, output_dir, pool_size=0, max_workers=1, chunk_size=1,
+                              schedule='fifo'):
+    """Simple batch conversion function"""
+    with DocxToPdfConverter(pool_size=pool_size) as converter:
+        return converter.batch_convert(
+            input_dir, output_dir, max_workers=max_workers, chunk_size=chunk_size,
+            schedule=schedule
+        )
 
 # Main execution
 if __name__ == "__main__":
     print("🚀 DOCX to PDF Converter with Bookmark Preservation (Fixed)")
     print("=" * 60)
     
-    if len(sys.argv) >= 3:
+    if len(sys.argv) >= 2 and sys.argv[1] == '--watch':
+        import argparse
+        parser = argparse.ArgumentParser(
+            prog='docx_converter_fixed.py --watch',
+            description="Hot folder: convert DOCX dropped into the watched directories"
+        )
+        parser.add_argument('input_dirs', nargs='+', help="Directories to watch")
+        parser.add_argument('--output-dir', help="PDF output (default: sibling 'output' dir)")
+        parser.add_argument('--failed-dir', help="Failed inputs (default: sibling 'failed' dir)")
+        parser.add_argument('--workers', type=int, default=2, help="Concurrent conversions")
+        parser.add_argument('--debounce', type=float, default=2.0,
+                            help="Seconds a file must be unchanged before converting")
+        args = parser.parse_args(sys.argv[2:])
+        try:
+            stats = watch_folders(args.input_dirs, args.output_dir, args.failed_dir,
+                                  args.workers, args.debounce)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Success: {stats['success']}  ❌ Failed: {stats['failed']}")
+    
+    elif len(sys.argv) >= 3:
         input_file = sys.argv[1]
         output_file = sys.argv[2]
         
@@ -550,6 +4021,7 @@ if __name__ == "__main__":
     else:
         print("Usage:")
         print("  python converter.py input.docx output.pdf")
+        print("  python converter.py --watch inbox/ [--workers 2] [--debounce 2]")
         print("\nOr use in code:")
         print("  from converter import convert_docx_to_pdf")
         print("  convert_docx_to_pdf('input.docx', 'output.pdf')")